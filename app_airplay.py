@@ -4,16 +4,42 @@ Pi-AirPlay: Raspberry Pi AirPlay Receiver
 A streamlined AirPlay receiver for Raspberry Pi with IQaudio DAC.
 """
 
-from flask import Flask, render_template, jsonify
+import sys
+
+
+def started_as_worker(argv):
+    """Check the command line for --role worker before argparse runs."""
+    for index, arg in enumerate(argv):
+        if arg == '--role=worker' or (arg == '--role' and argv[index + 1:index + 2] == ['worker']):
+            return True
+    return False
+
+
+# Workers serve clients with eventlet, whose message queue support needs the
+# standard library patched before anything else imports it
+if __name__ == '__main__' and started_as_worker(sys.argv):
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, render_template, jsonify, request
 import logging
 import os
 import threading
 import time
 import binascii
-from flask_socketio import SocketIO
+import functools
+import socket
+import json
+import statistics
+from collections import deque
+from flask_socketio import SocketIO, join_room, leave_room
 
-# Import only the audio controller for AirPlay
+# Import the audio controller and the Socket.IO topic helpers
 from utils.audio_control import AudioController
+from utils.topics import (TopicRegistry, TOPIC_EVENTS, LEGACY_TOPIC, LEGACY_EVENT,
+                          encode_payload, parse_topics, merge_snapshots)
+from utils.fanout import SnapshotStore, STATS_HEARTBEAT
+from utils.udp_metadata import UDPMetadataReceiver
 
 # Configure logging
 logging.basicConfig(
@@ -28,160 +54,320 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'pi-airplay-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Target for total background wakeups per second, reported by /wakeups
+app.config['WAKEUP_BUDGET'] = 1.0
+# 'all' reads the metadata pipe and serves clients, 'worker' only serves clients
+app.config['ROLE'] = 'all'
+# Workers behind a shared port have no sticky sessions, so skip long-polling
+app.config['WEBSOCKET_ONLY'] = False
+# Bound to the app (and an optional message queue) at startup
+socketio = SocketIO()
+
+# Initialize audio controller; the reader thread is started for the 'all' role only
+audio_controller = AudioController(autostart=False)
+
+# Latest topic payloads on the message queue broker, set when fanning out
+snapshot_store = None
+# This process's entry among the stats every fan-out process shares on the broker
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
 
-# Initialize audio controller
-audio_controller = AudioController()
+# Track which clients listen to which topics
+topic_registry = TopicRegistry()
+ALL_TOPICS = list(TOPIC_EVENTS) + [LEGACY_TOPIC]
+# Workers serve these over HTTP (/ and /now-playing), so the broker keeps them
+# current even while no client subscribes to them
+SNAPSHOT_TOPICS = ('track', LEGACY_TOPIC)
+
+# Time to first correct render reported by display pages, per render mode
+render_timings = {'ssr': deque(maxlen=500), 'fetch': deque(maxlen=500)}
 
 # Ensure artwork directory exists
 os.makedirs(os.path.join('static', 'artwork'), exist_ok=True)
 
+def build_metadata():
+    """Build the display metadata, falling back to the waiting screen when idle."""
+    # Get current metadata from audio controller
+    airplay_metadata = audio_controller.get_current_metadata()
+    
+    # Default metadata structure
+    metadata = {
+        'title': 'Waiting for music...',
+        'artist': 'Connect via AirPlay to start streaming',
+        'album': None,
+        'artwork': '/static/artwork/default_album.jpg',
+        'background_color': "#121212",
+        'airplay_active': False
+    }
+    
+    # Check if AirPlay is active
+    if audio_controller.is_playing():
+        # Only update if AirPlay is actually playing something
+        if airplay_metadata.get('title') != "Not Playing":
+            metadata = airplay_metadata
+            # Add the artwork URL if not present
+            if not metadata.get('artwork'):
+                metadata['artwork'] = '/static/artwork/default_album.jpg'
+            # Add background color if not present
+            if not metadata.get('background_color'):
+                metadata['background_color'] = "#121212"
+            # Set AirPlay active flag
+            metadata['airplay_active'] = True
+    
+    return metadata
+
+def build_debug_info():
+    """Collect pipe and process state for troubleshooting."""
+    pipe_path = audio_controller.pipe_path
+    pipe_exists = os.path.exists(pipe_path)
+    pipe_perms = 'N/A'
+    pipe_owner = 'N/A'
+    
+    if pipe_exists:
+        try:
+            stat = os.stat(pipe_path)
+            pipe_perms = oct(stat.st_mode)[-3:]
+            pipe_owner = f"{stat.st_uid}:{stat.st_gid}"
+        except OSError as e:
+            logger.error(f"Error checking pipe permissions: {e}")
+            
+    # Check for shairport-sync process more reliably, including ongoing restarts
+    shairport_running = False
+    try:
+        # Matches shairport-sync itself or a bash loop running it, without forking
+        shairport_running = audio_controller.shairport_running()
+    except Exception as e:
+        logger.error(f"Error checking for shairport-sync process: {e}")
+    
+    return {
+        'pipe_exists': pipe_exists,
+        'permissions': pipe_perms,
+        'owner': pipe_owner,
+        'shairport_running': shairport_running,
+        'airplay_active': audio_controller.is_playing(),
+        'last_error': None
+    }
+
+def build_topic_payload(topic, metadata, debug_info):
+    """Cut the payload for one topic out of the full metadata."""
+    if topic == 'track':
+        return {
+            'title': metadata.get('title'),
+            'artist': metadata.get('artist'),
+            'album': metadata.get('album'),
+            'artwork': metadata.get('artwork'),
+            'background_color': metadata.get('background_color'),
+            'airplay_active': metadata.get('airplay_active', False)
+        }
+    if topic == 'progress':
+        return {
+            'progress': metadata.get('progress'),
+            'airplay_active': metadata.get('airplay_active', False)
+        }
+    if topic == 'visualization':
+        return {
+            'volume': metadata.get('volume', 0),
+            'airplay_active': metadata.get('airplay_active', False)
+        }
+    if topic == 'diagnostics':
+        return debug_info
+    # Legacy clients get everything in one message
+    return dict(metadata, _debug=debug_info)
+
+def build_payloads(topics):
+    """Build payloads for the given topics, skipping work nobody needs."""
+    if app.config['ROLE'] == 'worker':
+        # Workers never read the pipe, they serve what the reader published
+        payloads = {topic: snapshot_store.get(topic) for topic in topics}
+        return {topic: payload for topic, payload in payloads.items() if payload is not None}
+    
+    metadata = None
+    debug_info = None
+    if any(topic != 'diagnostics' for topic in topics):
+        metadata = build_metadata()
+    if 'diagnostics' in topics or LEGACY_TOPIC in topics:
+        debug_info = build_debug_info()
+    return {topic: build_topic_payload(topic, metadata, debug_info) for topic in topics}
+
+def local_stats(kind):
+    """Return this process's 'topics' or 'render_timings' stats."""
+    if kind == 'topics':
+        return topic_registry.snapshot()
+    return {mode: list(samples) for mode, samples in render_timings.items()}
+
+def shared_stats(kind):
+    """Return the stats of every live process, this one's taken first-hand."""
+    stats = {}
+    if snapshot_store is not None:
+        try:
+            stats = snapshot_store.get_stats(kind)
+        except Exception as e:
+            logger.error(f"Error reading shared stats: {e}")
+    stats[PROCESS_ID] = local_stats(kind)
+    return list(stats.values())
+
+def share_stats(*kinds):
+    """Publish this process's stats to the broker when fanning out."""
+    if snapshot_store is None:
+        return
+    for kind in kinds or ('topics', 'render_timings'):
+        try:
+            snapshot_store.put_stats(kind, PROCESS_ID, local_stats(kind))
+        except Exception as e:
+            logger.error(f"Error sharing {kind} stats: {e}")
+
+def publish_topics():
+    """Emit changed payloads to every topic that has subscribers."""
+    if snapshot_store is not None:
+        # Subscribers may be connected to any worker, so count them all
+        merged = merge_snapshots(shared_stats('topics'))['topics']
+        subscribers = {topic: merged.get(topic, {}).get('subscribers', 0) for topic in ALL_TOPICS}
+        kept = SNAPSHOT_TOPICS
+    else:
+        subscribers = {topic: topic_registry.subscriber_count(topic) for topic in ALL_TOPICS}
+        kept = ()
+    
+    active = [topic for topic in ALL_TOPICS if subscribers[topic] or topic in kept]
+    for topic in ALL_TOPICS:
+        # Nobody received the changes since, so don't suppress the next payload
+        # or hand a stale snapshot to the next subscriber
+        if topic not in active and topic_registry.forget(topic) and snapshot_store is not None:
+            snapshot_store.clear(topic)
+    if not active:
+        return
+    
+    for topic, payload in build_payloads(active).items():
+        encoded = topic_registry.encode_if_changed(topic, payload)
+        if encoded is None:
+            continue
+        if snapshot_store is not None:
+            snapshot_store.put(topic, encoded)
+        if subscribers[topic]:
+            socketio.emit(topic_event(topic), payload, to=topic)
+            topic_registry.record_sent(topic, encoded, subscribers[topic])
+
+def reader_only(view):
+    """Reject requests for pipe and controller details on stateless workers."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if app.config['ROLE'] == 'worker':
+            return jsonify({
+                'error': 'Only available on the process reading the metadata pipe',
+                'role': app.config['ROLE']
+            }), 503
+        return view(*args, **kwargs)
+    return wrapper
+
+def topic_event(topic):
+    """Return the Socket.IO event name used for a topic."""
+    return TOPIC_EVENTS.get(topic, LEGACY_EVENT)
+
 def metadata_update_thread():
     """Thread to send metadata updates to clients."""
     logger.info("Starting metadata update thread")
+    generation = 0
     
     while True:
+        audio_controller.wakeups.tick()
         try:
-            # Get current metadata from audio controller
-            airplay_metadata = audio_controller.get_current_metadata()
-            
-            # Default metadata structure
-            metadata = {
-                'title': 'Waiting for music...',
-                'artist': 'Connect via AirPlay to start streaming',
-                'album': None,
-                'artwork': '/static/artwork/default_album.jpg',
-                'background_color': "#121212",
-                'airplay_active': False
-            }
-            
-            # Check if AirPlay is active
-            if audio_controller.is_playing():
-                # Only update if AirPlay is actually playing something
-                if airplay_metadata.get('title') != "Not Playing":
-                    metadata = airplay_metadata
-                    # Add the artwork URL if not present
-                    if not metadata.get('artwork'):
-                        metadata['artwork'] = '/static/artwork/default_album.jpg'
-                    # Add background color if not present
-                    if not metadata.get('background_color'):
-                        metadata['background_color'] = "#121212"
-                    # Set AirPlay active flag
-                    metadata['airplay_active'] = True
-            
-            # Add debug info for troubleshooting
-            pipe_path = '/tmp/shairport-sync-metadata'
-            pipe_exists = os.path.exists(pipe_path)
-            pipe_perms = 'N/A'
-            pipe_owner = 'N/A'
-            
-            if pipe_exists:
-                try:
-                    stat = os.stat(pipe_path)
-                    pipe_perms = oct(stat.st_mode)[-3:]
-                    pipe_owner = f"{stat.st_uid}:{stat.st_gid}"
-                except OSError as e:
-                    logger.error(f"Error checking pipe permissions: {e}")
-                    
-            # Check for shairport-sync process more reliably, including ongoing restarts
-            shairport_running = False
-            try:
-                # Look for any running shairport-sync command or a bash loop running it
-                check_process = os.popen('ps aux | grep -v grep | grep -E "shairport-sync|while true; do.*shairport-sync"').read().strip()
-                shairport_running = bool(check_process)
-            except Exception as e:
-                logger.error(f"Error checking for shairport-sync process: {e}")
-            
-            metadata['_debug'] = {
-                'pipe_exists': pipe_exists,
-                'permissions': pipe_perms,
-                'owner': pipe_owner,
-                'shairport_running': shairport_running,
-                'airplay_active': audio_controller.is_playing(),
-                'last_error': None
-            }
-            
-            # Send metadata to clients
-            socketio.emit('metadata_update', metadata)
-            
+            publish_topics()
         except Exception as e:
             logger.error(f"Error in metadata thread: {e}")
         
-        # Sleep to avoid too frequent updates
-        time.sleep(1)
+        if audio_controller.tickless:
+            # Block until new metadata arrives, or until playback times out so
+            # the "not playing" state still gets pushed. Idle waits forever.
+            timeout = audio_controller.seconds_until_inactive()
+            if timeout is not None:
+                timeout += 0.1
+            generation = audio_controller.wait_for_update(generation, timeout)
+        else:
+            # Sleep to avoid too frequent updates
+            time.sleep(1)
 
 # Start the metadata update thread
-metadata_thread = threading.Thread(target=metadata_update_thread)
+metadata_thread = threading.Thread(target=metadata_update_thread, name='metadata-emitter')
 metadata_thread.daemon = True
 
+def stats_heartbeat_thread():
+    """Keep this process's shared stats from expiring while nothing changes."""
+    while True:
+        share_stats()
+        socketio.sleep(STATS_HEARTBEAT)
+
+def stats_listener_thread():
+    """Wake the emitter when any process's subscriptions change, so new topics get published."""
+    while True:
+        try:
+            for _ in snapshot_store.watch_stats():
+                audio_controller.notify_update()
+        except Exception as e:
+            logger.error(f"Error watching shared stats: {e}")
+        time.sleep(5)
+
+def current_track_snapshot():
+    """Return the current track payload for inlining in the display page."""
+    if app.config['ROLE'] == 'worker':
+        # Kept current on the broker even without track subscribers
+        return snapshot_store.get('track')
+    # Cheap to build, and unlike the last published payload never stale
+    return build_payloads(['track']).get('track')
+
 @app.route('/')
 def index():
-    """Main display page."""
+    """Main display page, rendered with the current track so the first frame is correct."""
     logger.info("Display page requested")
-    return render_template('display.html')
+    initial = None
+    # ?ssr=0 serves the old fetch-after-load page, for comparing render timings
+    if request.args.get('ssr') != '0':
+        try:
+            initial = current_track_snapshot()
+        except Exception as e:
+            logger.error(f"Error building initial snapshot: {e}")
+    
+    return render_template('display.html',
+                          initial=initial,
+                          websocket_only=app.config['WEBSOCKET_ONLY'])
+
+@app.route('/render-timing', methods=['GET', 'POST'])
+def render_timing():
+    """Collect or summarize time to first correct render from display pages."""
+    if request.method == 'POST':
+        try:
+            # sendBeacon posts as text/plain, so parse the body ourselves
+            timing = json.loads(request.get_data(as_text=True))
+            render_timings[timing['mode']].append(float(timing['ms']))
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'error': 'Invalid timing report'}), 400
+        share_stats('render_timings')
+        return '', 204
+    
+    # Reports land on whichever worker served the page, so combine them all
+    summary = {}
+    processes = shared_stats('render_timings')
+    for mode in render_timings:
+        ordered = sorted(sample for stats in processes for sample in stats.get(mode, []))
+        summary[mode] = {
+            'samples': len(ordered),
+            'median_ms': round(statistics.median(ordered), 1) if ordered else None,
+            'p95_ms': round(ordered[max(int(len(ordered) * 0.95) - 1, 0)], 1) if ordered else None
+        }
+    return jsonify(summary)
 
 @app.route('/now-playing')
 def now_playing():
     """Get current playback metadata."""
     try:
-        # Get current metadata from audio controller
-        airplay_metadata = audio_controller.get_current_metadata()
-        
-        # Default metadata structure
-        metadata = {
-            'title': 'Waiting for music...',
-            'artist': 'Connect via AirPlay to start streaming',
-            'album': None,
-            'artwork': '/static/artwork/default_album.jpg',
-            'background_color': "#121212",
-            'airplay_active': False
-        }
+        if app.config['ROLE'] == 'worker':
+            # The legacy topic carries exactly this payload
+            metadata = snapshot_store.get(LEGACY_TOPIC)
+            if metadata is None:
+                raise RuntimeError("No snapshot published yet")
+            return jsonify(metadata)
         
-        # Check if AirPlay is active
-        if audio_controller.is_playing():
-            # Only update if AirPlay is actually playing something
-            if airplay_metadata.get('title') != "Not Playing":
-                metadata = airplay_metadata
-                # Add the artwork URL if not present
-                if not metadata.get('artwork'):
-                    metadata['artwork'] = '/static/artwork/default_album.jpg'
-                # Add background color if not present
-                if not metadata.get('background_color'):
-                    metadata['background_color'] = "#121212"
-                # Set AirPlay active flag
-                metadata['airplay_active'] = True
+        metadata = build_metadata()
         
         # Add debug info for troubleshooting
-        pipe_path = '/tmp/shairport-sync-metadata'
-        pipe_exists = os.path.exists(pipe_path)
-        pipe_perms = 'N/A'
-        pipe_owner = 'N/A'
-        
-        if pipe_exists:
-            try:
-                stat = os.stat(pipe_path)
-                pipe_perms = oct(stat.st_mode)[-3:]
-                pipe_owner = f"{stat.st_uid}:{stat.st_gid}"
-            except OSError as e:
-                logger.error(f"Error checking pipe permissions: {e}")
-                
-        # Check for shairport-sync process more reliably, including ongoing restarts
-        shairport_running = False
-        try:
-            # Look for any running shairport-sync command or a bash loop running it
-            check_process = os.popen('ps aux | grep -v grep | grep -E "shairport-sync|while true; do.*shairport-sync"').read().strip()
-            shairport_running = bool(check_process)
-        except Exception as e:
-            logger.error(f"Error checking for shairport-sync process: {e}")
-        
-        metadata['_debug'] = {
-            'pipe_exists': pipe_exists,
-            'permissions': pipe_perms,
-            'owner': pipe_owner,
-            'shairport_running': shairport_running,
-            'airplay_active': audio_controller.is_playing(),
-            'last_error': None
-        }
+        metadata['_debug'] = build_debug_info()
         
         return jsonify(metadata)
         
@@ -204,6 +390,7 @@ def now_playing():
         })
 
 @app.route('/debug')
+@reader_only
 def debug_interface():
     """Debug interface for troubleshooting issues."""
     logger.info("Debug page requested")
@@ -233,7 +420,7 @@ def debug_interface():
     }
     
     # Get metadata pipe info
-    pipe_path = '/tmp/shairport-sync-metadata'
+    pipe_path = audio_controller.pipe_path
     pipe_info = {
         'exists': os.path.exists(pipe_path),
         'permissions': 'N/A',
@@ -275,6 +462,17 @@ def debug_interface():
     # Add last error
     last_error = audio_controller.last_error or "No errors reported"
     
+    # Datagram and reassembly counters when metadata arrives over UDP
+    input_stats = None
+    if audio_controller.metadata_input is not None:
+        input_stats = audio_controller.metadata_input.snapshot()
+    
+    # Background thread wakeup rates
+    wakeup_stats = audio_controller.wakeups.snapshot(budget=app.config['WAKEUP_BUDGET'])
+    
+    # Socket.IO subscribers and traffic per topic, across all workers
+    topic_stats = merge_snapshots(shared_stats('topics'))
+    
     return render_template('debug.html', 
                           system_info=system_info,
                           shairport_info=shairport_info,
@@ -283,12 +481,25 @@ def debug_interface():
                           network_info=network_info,
                           metadata_state=metadata_state,
                           debug_counters=debug_counters,
+                          wakeup_stats=wakeup_stats,
+                          input_stats=input_stats,
+                          topic_stats=topic_stats,
                           last_error=last_error)
 
+@app.route('/wakeups')
+@reader_only
+def wakeups():
+    """Wakeups per second for each background thread, checked against the budget."""
+    stats = audio_controller.wakeups.snapshot(budget=app.config['WAKEUP_BUDGET'])
+    stats['tickless'] = audio_controller.tickless
+    stats['playing'] = audio_controller.is_playing()
+    return jsonify(stats)
+
 @app.route('/raw-pipe-data')
+@reader_only
 def raw_pipe_data():
     """View raw data from the metadata pipe."""
-    pipe_path = '/tmp/shairport-sync-metadata'
+    pipe_path = audio_controller.pipe_path
     
     if not os.path.exists(pipe_path):
         return jsonify({
@@ -325,13 +536,83 @@ def raw_pipe_data():
             'path': pipe_path
         })
 
+@app.route('/topics')
+def topics():
+    """Subscriber counts and bytes sent for each Socket.IO topic, across all workers."""
+    processes = shared_stats('topics')
+    return jsonify(dict(merge_snapshots(processes), processes=len(processes)))
+
+def send_current(topics):
+    """Send the current payload of each topic to the requesting client only."""
+    for topic, payload in build_payloads(topics).items():
+        socketio.emit(topic_event(topic), payload, to=request.sid)
+        topic_registry.record_sent(topic, encode_payload(payload), 1)
+
+def subscribe_client(topics):
+    """Move the requesting client into topic rooms and send their current state."""
+    joined, left = topic_registry.subscribe(request.sid, topics)
+    for topic in left:
+        leave_room(topic)
+    for topic in joined:
+        join_room(topic)
+    if joined:
+        send_current(joined)
+    return joined
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    """
+    Register a client. Clients can pass {topics: [...]} as connection auth to
+    subscribe right away; the rest get the full legacy payload.
+    """
     logger.info("Client connected")
+    topic_registry.add_client(request.sid)
+    join_room(LEGACY_TOPIC)
+    
+    joined = set()
+    if auth:
+        try:
+            joined = subscribe_client(parse_topics(auth))
+        except ValueError as e:
+            logger.warning(f"Ignoring connect topics: {e}")
+    if not joined:
+        # Unchanged payloads are never resent, so start with the current one
+        send_current([LEGACY_TOPIC])
+    share_stats('topics')
 
 @socketio.on('disconnect')
 def handle_disconnect():
     logger.info("Client disconnected")
+    topic_registry.remove_client(request.sid)
+    share_stats('topics')
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join topic rooms and send each new topic's current state right away."""
+    try:
+        topics = parse_topics(data)
+    except ValueError as e:
+        return {'error': str(e)}
+    
+    joined = subscribe_client(topics)
+    share_stats('topics')
+    unknown = sorted(set(topics) - set(TOPIC_EVENTS))
+    logger.info(f"Client subscribed to: {', '.join(sorted(joined)) or 'nothing new'}")
+    return {'subscribed': sorted(joined), 'unknown': unknown}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave topic rooms."""
+    try:
+        topics = parse_topics(data)
+    except ValueError as e:
+        return {'error': str(e)}
+    
+    left = topic_registry.unsubscribe(request.sid, topics)
+    share_stats('topics')
+    for topic in left:
+        leave_room(topic)
+    return {'unsubscribed': sorted(left)}
 
 if __name__ == '__main__':
     import argparse
@@ -340,18 +621,92 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Pi-AirPlay: Raspberry Pi AirPlay Receiver')
     parser.add_argument('--port', type=int, default=8000, help='Port to run the web server on (default: 8000)')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host address to bind to (default: 0.0.0.0)')
+    parser.add_argument('--tickless', action='store_true', help='Block on metadata events instead of polling while idle')
+    parser.add_argument('--wakeup-budget', type=float, default=1.0, help='Target wakeups per second reported by /wakeups (default: 1.0)')
+    parser.add_argument('--message-queue', type=str, default=None, help='Redis URL used to fan out updates to other worker processes')
+    parser.add_argument('--role', choices=['all', 'worker'], default='all', help='all: read metadata and serve clients, worker: only serve clients (default: all)')
+    parser.add_argument('--workers', type=int, default=0, help='Spawn this many worker processes sharing --port; this process moves to --primary-port')
+    parser.add_argument('--primary-port', type=int, default=8001, help='Port for the reading process when --workers is used (default: 8001)')
+    parser.add_argument('--metadata-udp-port', type=int, default=None, help='Receive shairport-sync metadata on this UDP port instead of the pipe')
+    parser.add_argument('--metadata-bind', type=str, default='0.0.0.0', help='Local address (or multicast interface) for UDP metadata (default: 0.0.0.0)')
+    parser.add_argument('--metadata-multicast', type=str, default=None, help='Multicast group to join for UDP metadata, e.g. 226.0.0.1')
     args = parser.parse_args()
     
     try:
-        logger.info(f"Starting Pi-AirPlay on {args.host}:{args.port}...")
+        if (args.role == 'worker' or args.workers) and not args.message_queue:
+            parser.error('--role worker and --workers need --message-queue')
+        
+        app.config['ROLE'] = args.role
+        app.config['WAKEUP_BUDGET'] = args.wakeup_budget
+        # The reading process keeps real threads for the metadata pipe; with a
+        # message queue that rules out unpatched eventlet, so use threading
+        async_mode = None
+        if args.message_queue:
+            snapshot_store = SnapshotStore(args.message_queue)
+            if args.role == 'all':
+                async_mode = 'threading'
+        socketio.init_app(app, cors_allowed_origins="*", message_queue=args.message_queue,
+                          async_mode=async_mode)
+        
+        if args.workers:
+            import atexit
+            import signal
+            import subprocess
+            
+            # Workers bind the same port with SO_REUSEPORT (eventlet's default),
+            # so the kernel spreads connections and clients must use websockets
+            worker_cmd = [sys.executable, os.path.abspath(__file__), '--role', 'worker',
+                          '--message-queue', args.message_queue,
+                          '--host', args.host, '--port', str(args.port)]
+            workers = [subprocess.Popen(worker_cmd) for _ in range(args.workers)]
+            
+            def stop_workers():
+                for worker in workers:
+                    if worker.poll() is None:
+                        worker.terminate()
+                for worker in workers:
+                    try:
+                        worker.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        worker.kill()
+            
+            # atexit doesn't run on SIGTERM (systemctl stop), so turn it into a normal exit
+            atexit.register(stop_workers)
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            logger.info(f"Started {args.workers} workers on {args.host}:{args.port}")
+            args.port = args.primary_port
+        
+        if args.role == 'worker':
+            app.config['WEBSOCKET_ONLY'] = True
         
-        # Start the metadata update thread
-        metadata_thread.start()
+        logger.info(f"Starting Pi-AirPlay ({args.role}) on {args.host}:{args.port}...")
+        
+        if snapshot_store is not None:
+            if args.role == 'all':
+                # Snapshots left by an earlier run may be stale
+                for topic in ALL_TOPICS:
+                    snapshot_store.clear(topic)
+                socketio.start_background_task(stats_listener_thread)
+            socketio.start_background_task(stats_heartbeat_thread)
+        
+        if args.role == 'all':
+            if args.metadata_udp_port:
+                audio_controller.set_input(UDPMetadataReceiver(
+                    port=args.metadata_udp_port,
+                    bind_address=args.metadata_bind,
+                    multicast_group=args.metadata_multicast,
+                    wakeups=audio_controller.wakeups))
+            audio_controller.set_tickless(args.tickless)
+            audio_controller.start()
+            
+            # Start the metadata update thread
+            metadata_thread.start()
         
         # Use host from args (default 0.0.0.0) to ensure the server is accessible externally
         # Set debug=False to avoid common issues with Flask debugging
         socketio.run(app, host=args.host, port=args.port, debug=False, 
-                    use_reloader=False, log_output=True)
+                    use_reloader=False, log_output=True,
+                    allow_unsafe_werkzeug=async_mode == 'threading')
                     
     except Exception as e:
         logger.error(f"Failed to start Pi-AirPlay: {e}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Pi-AirPlay first render benchmark.
+Starts the app with UDP metadata input, plays a track into it and loads the
+display page repeatedly in both modes: server-rendered (/) and the old
+fetch-after-load page (/?ssr=0 followed by /now-playing). Reports median and
+p95 time until the page has the correct track, without a browser, so script
+parsing and painting are not included.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from utils.fanout import wait_for_port
+from utils.udp_metadata import encode_packets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_airplay.py')
+
+INITIAL_METADATA = re.compile(r'<script id="initial-metadata" type="application/json">(.*?)</script>', re.S)
+
+
+def play_track(port, title):
+    """Send a track to the app the way shairport-sync would over UDP."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for code, value in ((b'minm', title), (b'asar', 'Benchmark Artist'), (b'asal', 'Benchmark Album')):
+        for packet in encode_packets(b'core', code, value.encode('utf-8')):
+            sock.sendto(packet, ('127.0.0.1', port))
+    sock.close()
+
+
+def start_shairport_stand_in():
+    """
+    The app only reports playback while a shairport-sync process runs, so run
+    sleep under that name as a stand-in.
+    """
+    workdir = tempfile.mkdtemp(prefix='pi-airplay-bench-')
+    binary = os.path.join(workdir, 'shairport-sync')
+    shutil.copy(shutil.which('sleep'), binary)
+    return subprocess.Popen([binary, 'infinity']), workdir
+
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read().decode('utf-8')
+
+
+def load_ssr(base_url, title):
+    """Load the server-rendered page; return seconds until it holds the track."""
+    started = time.perf_counter()
+    html = fetch(base_url + '/')
+    match = INITIAL_METADATA.search(html)
+    elapsed = time.perf_counter() - started
+    if not match or json.loads(match.group(1)).get('title') != title:
+        return None
+    return elapsed
+
+
+def load_fetch(base_url, title):
+    """Load the old page and its /now-playing request; return seconds until it holds the track."""
+    started = time.perf_counter()
+    fetch(base_url + '/?ssr=0')
+    metadata = json.loads(fetch(base_url + '/now-playing'))
+    elapsed = time.perf_counter() - started
+    if metadata.get('title') != title:
+        return None
+    return elapsed
+
+
+def summarize(mode, samples, attempts):
+    ordered = sorted(samples)
+    if not ordered:
+        print(f"{mode:6s} no correct renders out of {attempts}")
+        return
+    print(f"{mode:6s} correct {len(ordered)}/{attempts}  "
+          f"median {statistics.median(ordered) * 1000:7.2f} ms  "
+          f"p95 {ordered[max(int(len(ordered) * 0.95) - 1, 0)] * 1000:7.2f} ms  "
+          f"max {ordered[-1] * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pi-AirPlay first render benchmark')
+    parser.add_argument('--samples', type=int, default=200, help='Page loads per mode (default: 200)')
+    parser.add_argument('--port', type=int, default=8300, help='Web port for the app under test (default: 8300)')
+    parser.add_argument('--udp-port', type=int, default=5597, help='UDP metadata port for the app under test (default: 5597)')
+    parser.add_argument('--tickless', action='store_true', help='Run the app in tickless idle mode')
+    args = parser.parse_args()
+
+    cmd = [sys.executable, APP_PATH, '--host', '127.0.0.1', '--port', str(args.port),
+           '--metadata-udp-port', str(args.udp_port), '--metadata-bind', '127.0.0.1']
+    if args.tickless:
+        cmd.append('--tickless')
+    stand_in, workdir = start_shairport_stand_in()
+    app = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port('127.0.0.1', args.port, timeout=30):
+            raise RuntimeError(f"App did not start listening on port {args.port}")
+        base_url = f"http://127.0.0.1:{args.port}"
+
+        title = 'Benchmark Track'
+        play_track(args.udp_port, title)
+        time.sleep(0.5)
+
+        results = {'ssr': [], 'fetch': []}
+        for index in range(args.samples):
+            # Alternate modes so both see the same conditions
+            for mode, load in (('ssr', load_ssr), ('fetch', load_fetch)):
+                elapsed = load(base_url, title)
+                if elapsed is not None:
+                    results[mode].append(elapsed)
+            if index % 50 == 49:
+                # Keep playback from timing out during long runs
+                play_track(args.udp_port, title)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        stand_in.kill()
+        stand_in.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    for mode, samples in results.items():
+        summarize(mode, samples, args.samples)
+
+
+if __name__ == '__main__':
+    main()
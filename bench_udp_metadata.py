@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Pi-AirPlay UDP metadata benchmark.
+A local sender stand-in emits shairport-sync style datagrams (text items plus
+chunked artwork) to UDPMetadataReceiver, optionally dropping a fraction of the
+packets, and reports loss, throughput and delivery latency for each consumer.
+"""
+
+import argparse
+import logging
+import os
+import random
+import socket
+import statistics
+import struct
+import threading
+import time
+import zlib
+
+from utils.udp_metadata import UDPMetadataReceiver, encode_packets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Every benchmark item starts with its send time and sequence number
+STAMP = struct.Struct('>dI')
+
+TEXT_CODES = (b'minm', b'asar', b'asal')
+
+
+class BenchConsumer:
+    def __init__(self, expected):
+        """
+        Records what one consumer received.
+
+        Args:
+            expected: Mapping of sequence number to CRC of the data sent
+        """
+        self.expected = expected
+        self.lock = threading.Lock()
+        self.received = 0
+        self.corrupt = 0
+        self.bytes = 0
+        self.latencies = []
+        self.last_receive = None
+
+    def __call__(self, item_type, code, data):
+        now = time.time()
+        sent_at, seq = STAMP.unpack_from(data)
+        with self.lock:
+            self.received += 1
+            self.bytes += len(data)
+            self.latencies.append(now - sent_at)
+            self.last_receive = time.monotonic()
+            if self.expected.get(seq) != zlib.crc32(data[STAMP.size:]):
+                self.corrupt += 1
+
+
+def send_items(args, target, expected):
+    """Send the benchmark items and return (items, packets, bytes, dropped packets)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if args.multicast:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    artwork = os.urandom(args.artwork_size)
+    packets_sent = bytes_sent = dropped = 0
+
+    for seq in range(args.items):
+        if args.artwork_every and seq % args.artwork_every == 0:
+            item_type, code, payload = b'ssnc', b'PICT', artwork
+        else:
+            item_type, code = b'core', random.choice(TEXT_CODES)
+            payload = f"Benchmark item {seq}".encode('utf-8')
+        expected[seq] = zlib.crc32(payload)
+        data = STAMP.pack(time.time(), seq) + payload
+
+        for packet in encode_packets(item_type, code, data, args.packet_size):
+            if args.loss and random.random() < args.loss:
+                dropped += 1
+                continue
+            sock.sendto(packet, target)
+            packets_sent += 1
+            bytes_sent += len(packet)
+        if args.rate:
+            time.sleep(1.0 / args.rate)
+
+    sock.close()
+    return args.items, packets_sent, bytes_sent, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pi-AirPlay UDP metadata benchmark')
+    parser.add_argument('--items', type=int, default=2000, help='Items to send (default: 2000)')
+    parser.add_argument('--rate', type=float, default=0, help='Items per second, 0 sends as fast as possible (default: 0)')
+    parser.add_argument('--artwork-every', type=int, default=20, help='Send artwork as every Nth item, 0 for none (default: 20)')
+    parser.add_argument('--artwork-size', type=int, default=200 * 1024, help='Artwork size in bytes (default: 200 KB)')
+    parser.add_argument('--packet-size', type=int, default=1024, help='Largest datagram, like socket_msglength (default: 1024)')
+    parser.add_argument('--loss', type=float, default=0.0, help='Fraction of packets the sender drops (default: 0)')
+    parser.add_argument('--consumers', type=int, default=1, help='Independent consumers (default: 1)')
+    parser.add_argument('--multicast', type=str, default=None, help='Multicast group; each consumer then gets its own socket')
+    parser.add_argument('--port', type=int, default=5599, help='UDP port (default: 5599)')
+    parser.add_argument('--chunk-timeout', type=float, default=2.0, help='Seconds before incomplete artwork is dropped (default: 2.0)')
+    args = parser.parse_args()
+
+    expected = {}
+    consumers = [BenchConsumer(expected) for _ in range(args.consumers)]
+
+    # Multicast gives every consumer its own copy of the stream; unicast
+    # datagrams reach one socket, so consumers share a single receiver
+    if args.multicast:
+        receivers = [UDPMetadataReceiver(port=args.port, multicast_group=args.multicast,
+                                         chunk_timeout=args.chunk_timeout)
+                     for _ in consumers]
+        for receiver, consumer in zip(receivers, consumers):
+            receiver.add_consumer(consumer)
+        target = (args.multicast, args.port)
+    else:
+        receivers = [UDPMetadataReceiver(port=args.port, bind_address='127.0.0.1',
+                                         chunk_timeout=args.chunk_timeout)]
+        for consumer in consumers:
+            receivers[0].add_consumer(consumer)
+        target = ('127.0.0.1', args.port)
+
+    for receiver in receivers:
+        receiver.start()
+
+    started = time.monotonic()
+    items, packets, sent_bytes, dropped = send_items(args, target, expected)
+    send_seconds = time.monotonic() - started
+
+    # Wait until deliveries stop, then let incomplete artwork time out
+    time.sleep(args.chunk_timeout + 0.5)
+    for receiver in receivers:
+        receiver.stop()
+
+    print()
+    print(f"Sent {items} items in {packets} packets ({sent_bytes / 1e6:.2f} MB) in {send_seconds:.2f}s, "
+          f"{dropped} packets dropped by the sender")
+    for index, consumer in enumerate(consumers):
+        receiver = receivers[index] if args.multicast else receivers[0]
+        stats = receiver.snapshot()
+        latencies = sorted(consumer.latencies)
+        active = (consumer.last_receive or started) - started
+        print(f"consumer {index}: received {consumer.received}/{items} "
+              f"({100.0 * (items - consumer.received) / items:.2f}% lost), corrupt {consumer.corrupt}, "
+              f"dropped incomplete {stats['dropped_incomplete']}, "
+              f"socket packets {stats['packets']}/{packets}")
+        if latencies:
+            print(f"  throughput {consumer.received / max(active, 1e-6):.0f} items/s, "
+                  f"{consumer.bytes / max(active, 1e-6) / 1e6:.2f} MB/s, "
+                  f"latency p50 {statistics.median(latencies) * 1000:.2f} ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms, "
+                  f"max {latencies[-1] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Pi-AirPlay fan-out load test.
+Starts N stateless worker processes sharing one port, connects many Socket.IO
+clients to it, publishes timestamped track updates through the message queue
+and reports connected clients and push latency for each worker count.
+
+Uses a local Redis when --message-queue is given, otherwise an in-process
+stand-in broker. Needs the python-socketio client and websocket-client.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from flask_socketio import SocketIO
+
+from utils.fanout import StandInBroker, wait_for_port
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_airplay.py')
+
+
+class LoadClient:
+    def __init__(self, url):
+        """
+        A Socket.IO client subscribed to the track topic.
+
+        Args:
+            url: Base URL of the shared worker port
+        """
+        self.url = url
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('track_update', self._on_track_update)
+
+    def _on_track_update(self, data):
+        sent_at = data.get('sent_at') if isinstance(data, dict) else None
+        if sent_at is None:
+            return
+        with self.lock:
+            self.latencies.append(time.time() - sent_at)
+
+    def connect(self):
+        """Connect over websocket (no sticky sessions) and subscribe."""
+        try:
+            self.sio.connect(self.url, transports=['websocket'], auth={'topics': ['track']})
+            return True
+        except Exception as e:
+            logger.warning(f"Client failed to connect: {e}")
+            return False
+
+    def close(self):
+        if self.sio.connected:
+            self.sio.disconnect()
+
+
+def start_workers(count, message_queue, host, port):
+    """Start worker processes bound to the same port."""
+    cmd = [sys.executable, APP_PATH, '--role', 'worker',
+           '--message-queue', message_queue, '--host', host, '--port', str(port)]
+    workers = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for _ in range(count)]
+    if not wait_for_port(host, port, timeout=30):
+        raise RuntimeError(f"Workers did not start listening on {host}:{port}")
+    # The first worker to bind answers wait_for_port, give the rest a moment
+    time.sleep(1.0 + 0.25 * count)
+    return workers
+
+
+def stop_workers(workers):
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+def run_round(worker_count, args, message_queue, emitter):
+    """Measure one worker count and return its result row."""
+    workers = start_workers(worker_count, message_queue, args.host, args.port)
+    clients = [LoadClient(f"http://{args.host}:{args.port}") for _ in range(args.clients)]
+    try:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            connected = sum(pool.map(LoadClient.connect, clients))
+        connect_seconds = time.monotonic() - started
+        # Let subscriptions land before publishing
+        time.sleep(1.0)
+
+        for index in range(args.messages):
+            emitter.emit('track_update', {
+                'title': f"Load test {index}",
+                'artist': 'Pi-AirPlay',
+                'album': None,
+                'artwork': '/static/artwork/default_album.jpg',
+                'background_color': '#121212',
+                'airplay_active': True,
+                'sent_at': time.time()
+            }, to='track')
+            time.sleep(args.interval)
+        time.sleep(args.drain)
+
+        latencies = []
+        for client in clients:
+            with client.lock:
+                latencies.extend(client.latencies)
+        still_connected = sum(1 for client in clients if client.sio.connected)
+    finally:
+        for client in clients:
+            client.close()
+        stop_workers(workers)
+
+    latencies.sort()
+    return {
+        'workers': worker_count,
+        'connected': connected,
+        'still_connected': still_connected,
+        'connect_seconds': connect_seconds,
+        'delivered': len(latencies),
+        'expected': connected * args.messages,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+        'max_ms': latencies[-1] * 1000 if latencies else None,
+    }
+
+
+def format_ms(value):
+    return f"{value:8.1f}" if value is not None else "       -"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pi-AirPlay fan-out load test')
+    parser.add_argument('--workers', type=str, default='1,2,4', help='Comma-separated worker counts to test (default: 1,2,4)')
+    parser.add_argument('--clients', type=int, default=50, help='Socket.IO clients per round (default: 50)')
+    parser.add_argument('--messages', type=int, default=20, help='Track updates published per round (default: 20)')
+    parser.add_argument('--interval', type=float, default=0.2, help='Seconds between updates (default: 0.2)')
+    parser.add_argument('--drain', type=float, default=2.0, help='Seconds to wait for late deliveries (default: 2.0)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address the workers bind to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8100, help='Shared worker port (default: 8100)')
+    parser.add_argument('--message-queue', type=str, default=None, help='Redis URL; omit to use the stand-in broker')
+    args = parser.parse_args()
+
+    broker = None
+    message_queue = args.message_queue
+    if message_queue is None:
+        broker = StandInBroker().start()
+        message_queue = broker.url
+
+    # Write-only emitter, the same path the reading process publishes through
+    # (threading mode, as eventlet's Redis client needs a monkey-patched process)
+    emitter = SocketIO(message_queue=message_queue, async_mode='threading')
+
+    results = []
+    try:
+        for worker_count in [int(count) for count in args.workers.split(',')]:
+            logger.info(f"Testing {worker_count} worker(s) with {args.clients} clients")
+            results.append(run_round(worker_count, args, message_queue, emitter))
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    print()
+    print("workers  connected  delivered/expected  connect_s   p50_ms   p95_ms   max_ms")
+    for row in results:
+        print(f"{row['workers']:7d}  {row['still_connected']:4d}/{row['connected']:<4d}"
+              f"  {row['delivered']:8d}/{row['expected']:<8d}  {row['connect_seconds']:9.2f}"
+              f" {format_ms(row['p50_ms'])} {format_ms(row['p95_ms'])} {format_ms(row['max_ms'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Pi-AirPlay soak test.
+Runs the web app on a local port for hours with synthetic shairport-sync
+metadata (track changes with artwork, volume and progress) arriving over UDP
+or a private FIFO, while a separate process churns real Socket.IO client
+connections and /debug and /raw-pipe-data are polled over HTTP. Samples RSS,
+tracemalloc top allocators, open file descriptors and thread count of the
+server process, and fails if any of them grows faster than the configured
+slope or if metadata never reaches the clients.
+"""
+
+import argparse
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from collections import deque
+
+from PIL import Image
+
+import app_airplay
+from bench_first_render import start_shairport_stand_in
+from utils.audio_control import AudioController
+from utils.fanout import wait_for_port
+from utils.topics import TOPIC_EVENTS
+from utils.udp_metadata import UDPMetadataReceiver, encode_packets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+# One line per request, plus a 400 for every websocket close frame that reaches
+# werkzeug after the handler returned, would bury the samples
+logging.getLogger('werkzeug').setLevel(logging.CRITICAL)
+
+
+def read_rss_kb():
+    """Return the resident set size of this process in KB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def count_open_fds():
+    """Return the number of open file descriptors of this process."""
+    return len(os.listdir('/proc/self/fd'))
+
+
+def count_threads():
+    """Return the number of native threads, including ones Python didn't start."""
+    return len(os.listdir('/proc/self/task'))
+
+
+def slope_per_hour(samples):
+    """Least-squares slope of (seconds, value) samples, in units per hour."""
+    if len(samples) < 2:
+        return 0.0
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_v = sum(v for _, v in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    if var_t == 0:
+        return 0.0
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in samples)
+    return cov / var_t * 3600
+
+
+def make_artwork(size=300):
+    """Return a JPEG of random colour and quality, like album art of varying size."""
+    image = Image.new('RGB', (size, size), tuple(random.randint(0, 255) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=random.randint(50, 95))
+    return buffer.getvalue()
+
+
+class MetadataWriter:
+    def __init__(self, controller, args, pipe_path):
+        """
+        Plays synthetic tracks into the controller under test: title, artist,
+        album and artwork on every track change, volume and progress in between.
+
+        Args:
+            controller: AudioController under test
+            args: Parsed command-line arguments
+            pipe_path: FIFO the controller reads when --input is fifo
+        """
+        self.controller = controller
+        self.args = args
+        self.pipe_path = pipe_path
+        self.running = True
+        self.items_written = 0
+        self.tracks_played = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.pipe_fd = None
+        self.thread = threading.Thread(target=self._run, name='soak-writer')
+        self.thread.daemon = True
+
+    def _send(self, item_type, code, data):
+        if self.args.input == 'udp':
+            for packet in encode_packets(item_type, code, data):
+                self.sock.sendto(packet, ('127.0.0.1', self.args.udp_port))
+        else:
+            # The FIFO framing only has a one-byte code, so the known codes are
+            # handed to the controller the way an input would, while random
+            # frames keep the pipe reader busy
+            if self.pipe_fd is None:
+                self.pipe_fd = os.open(self.pipe_path, os.O_WRONLY)
+            noise = os.urandom(random.choice((8, 32, 256, 1024)))
+            try:
+                os.write(self.pipe_fd, struct.pack('>BBH', random.randint(1, 3), random.randint(0, 255), len(noise)) + noise)
+            except BrokenPipeError:
+                # The reader reopened the pipe; open it again next time
+                os.close(self.pipe_fd)
+                self.pipe_fd = None
+            self.controller._process_input_item(item_type, code, memoryview(data))
+        self.items_written += 1
+
+    def _play_track(self):
+        self.tracks_played += 1
+        track = self.tracks_played
+        self._send(b'core', b'minm', f"Soak track {track}".encode('utf-8'))
+        self._send(b'core', b'asar', f"Soak artist {track % 7}".encode('utf-8'))
+        self._send(b'core', b'asal', f"Soak album {track % 3}".encode('utf-8'))
+        self._send(b'ssnc', b'PICT', make_artwork(random.choice((100, 300, 600))))
+
+    def _run(self):
+        next_track = time.monotonic()
+        try:
+            while self.running:
+                if time.monotonic() >= next_track:
+                    self._play_track()
+                    next_track = time.monotonic() + self.args.track_interval
+                elif random.random() < 0.5:
+                    self._send(b'ssnc', b'pvol', bytes([1, random.randint(0, 255), 0, 0]))
+                else:
+                    start = random.randint(0, 1000)
+                    self._send(b'ssnc', b'prgr', struct.pack('>IIII', start, start + random.randint(0, 100), start + 100, 0))
+                time.sleep(1.0 / self.args.metadata_rate)
+        finally:
+            if self.pipe_fd is not None:
+                os.close(self.pipe_fd)
+            self.sock.close()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5)
+
+
+def churn_clients(url, args, stop, results):
+    """
+    Keep args.clients real Socket.IO clients connected to url, replacing one
+    every churn interval, until stop is set. Runs in its own process so the
+    server's fd and thread counts only include server-side resources.
+    """
+    import socketio
+
+    counters = {'connects': 0, 'disconnects': 0, 'connect_failures': 0, 'updates_received': 0}
+    lock = threading.Lock()
+
+    def on_update(*_):
+        with lock:
+            counters['updates_received'] += 1
+
+    clients = deque()
+    while not stop.is_set():
+        if len(clients) >= args.clients:
+            client = clients.popleft()
+            client.disconnect()
+            counters['disconnects'] += 1
+
+        client = socketio.Client(reconnection=False)
+        for event in list(TOPIC_EVENTS.values()) + ['metadata_update']:
+            client.on(event, on_update)
+        # Mix transports so long-polling sessions are churned too, and leave
+        # some clients on the legacy payload
+        topics = random.sample(list(TOPIC_EVENTS), random.randint(0, 2))
+        try:
+            client.connect(url, transports=random.choice((['websocket'], ['polling'])),
+                           auth={'topics': topics} if topics else None, wait_timeout=10)
+            clients.append(client)
+            counters['connects'] += 1
+        except Exception:
+            counters['connect_failures'] += 1
+        stop.wait(args.churn_interval)
+
+    while clients:
+        clients.popleft().disconnect()
+        counters['disconnects'] += 1
+    results.put(counters)
+
+
+class SoakHarness:
+    def __init__(self, args):
+        """
+        Set up the controller, server and samplers under test.
+
+        Args:
+            args: Parsed command-line arguments
+        """
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='pi-airplay-soak-')
+        self.pipe_path = os.path.join(self.workdir, 'metadata')
+        os.mkfifo(self.pipe_path)
+
+        # Point the app at a controller reading our private FIFO or UDP port
+        controller = AudioController(pipe_path=self.pipe_path, tickless=args.tickless, autostart=False)
+        if args.input == 'udp':
+            controller.set_input(UDPMetadataReceiver(port=args.udp_port, bind_address='127.0.0.1',
+                                                     wakeups=controller.wakeups))
+        app_airplay.audio_controller = controller
+        app_airplay.socketio.init_app(app_airplay.app, async_mode='threading')
+        self.url = f"http://127.0.0.1:{args.port}"
+
+        self.writer = MetadataWriter(controller, args, self.pipe_path)
+        self.samples = []
+        self.counters = {'debug_hits': 0, 'raw_pipe_hits': 0, 'http_errors': 0}
+
+    def _serve(self):
+        app_airplay.socketio.run(app_airplay.app, host='127.0.0.1', port=self.args.port,
+                                 debug=False, use_reloader=False, log_output=False,
+                                 allow_unsafe_werkzeug=True)
+
+    def _hit(self, path, counter):
+        try:
+            with urllib.request.urlopen(self.url + path, timeout=10) as response:
+                response.read()
+            self.counters[counter] += 1
+        except Exception as e:
+            logger.warning(f"GET {path} failed: {e}")
+            self.counters['http_errors'] += 1
+
+    def _sample(self, elapsed, baseline):
+        snapshot = tracemalloc.take_snapshot()
+        traced, _ = tracemalloc.get_traced_memory()
+        top = snapshot.compare_to(baseline, 'lineno')[:self.args.top]
+        topic_stats = app_airplay.topic_registry.snapshot()
+        sample = {
+            'elapsed': elapsed,
+            'rss_kb': read_rss_kb(),
+            'open_fds': count_open_fds(),
+            'threads': count_threads(),
+            'traced_kb': traced // 1024,
+            'clients': topic_stats['clients'],
+            'bytes_sent': topic_stats['total_bytes_sent'],
+        }
+        self.samples.append(sample)
+        logger.info(f"t={elapsed / 60:.1f}min rss={sample['rss_kb']}KB fds={sample['open_fds']} "
+                    f"threads={sample['threads']} traced={sample['traced_kb']}KB clients={sample['clients']} "
+                    f"sent={sample['bytes_sent'] // 1024}KB tracks={self.writer.tracks_played}")
+        for stat in top:
+            logger.info(f"  {stat}")
+        return top
+
+    def run(self):
+        """Run for the configured duration and return True if all checks pass."""
+        stand_in, stand_in_dir = start_shairport_stand_in()
+        tracemalloc.start(self.args.traceback_depth)
+        app_airplay.audio_controller.start()
+        app_airplay.metadata_thread.start()
+        server = threading.Thread(target=self._serve, name='soak-server')
+        server.daemon = True
+        server.start()
+        if not wait_for_port('127.0.0.1', self.args.port):
+            raise RuntimeError(f"Server did not start listening on port {self.args.port}")
+        self.writer.start()
+
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        results = context.Queue()
+        churner = context.Process(target=churn_clients, args=(self.url, self.args, stop, results),
+                                  name='soak-clients')
+        churner.start()
+        baseline = tracemalloc.take_snapshot()
+
+        started = time.monotonic()
+        next_hit = next_sample = started
+        top = []
+        client_counters = {}
+        try:
+            while True:
+                now = time.monotonic()
+                elapsed = now - started
+                if elapsed >= self.args.duration:
+                    break
+                if now >= next_hit:
+                    self._hit('/debug', 'debug_hits')
+                    self._hit('/raw-pipe-data', 'raw_pipe_hits')
+                    next_hit = now + self.args.hit_interval
+                if now >= next_sample:
+                    top = self._sample(elapsed, baseline)
+                    next_sample = now + self.args.sample_interval
+                time.sleep(0.05)
+        finally:
+            stop.set()
+            try:
+                client_counters = results.get(timeout=60)
+            except Exception as e:
+                logger.error(f"Client process reported no results: {e}")
+            churner.join(timeout=10)
+            self.writer.stop()
+            stand_in.kill()
+            stand_in.wait()
+            shutil.rmtree(stand_in_dir, ignore_errors=True)
+
+        return self._report(top, client_counters)
+
+    def _report(self, top, client_counters):
+        """Print slopes after the warmup period and compare them to the limits."""
+        if self.args.csv:
+            with open(self.args.csv, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.samples[0]))
+                writer.writeheader()
+                writer.writerows(self.samples)
+
+        steady = [s for s in self.samples if s['elapsed'] >= self.args.warmup]
+        limits = {
+            'rss_kb': self.args.max_rss_slope,
+            'traced_kb': self.args.max_traced_slope,
+            'open_fds': self.args.max_fd_slope,
+            'threads': self.args.max_thread_slope,
+        }
+
+        print()
+        print(f"Samples after warmup: {len(steady)}, writer items: {self.writer.items_written}, "
+              f"tracks: {self.writer.tracks_played}, {self.counters}, clients: {client_counters}")
+        passed = True
+        for metric, limit in limits.items():
+            slope = slope_per_hour([(s['elapsed'], s[metric]) for s in steady])
+            ok = slope <= limit
+            passed = passed and ok
+            print(f"  {metric:10s} slope {slope:10.2f}/h  limit {limit:10.2f}/h  {'OK' if ok else 'FAIL'}")
+
+        # Without updates reaching clients the push and artwork paths weren't soaked
+        updates = client_counters.get('updates_received', 0)
+        if not updates or self.writer.tracks_played < 2:
+            passed = False
+            print(f"  metadata never reached the clients ({updates} updates)  FAIL")
+
+        print("Top allocators since start:")
+        for stat in top:
+            print(f"  {stat}")
+        print("PASS" if passed else "FAIL")
+        return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pi-AirPlay soak test')
+    parser.add_argument('--duration', type=float, default=4 * 3600, help='Seconds to run (default: 4 hours)')
+    parser.add_argument('--warmup', type=float, default=600, help='Seconds ignored before fitting slopes (default: 600)')
+    parser.add_argument('--sample-interval', type=float, default=60, help='Seconds between samples (default: 60)')
+    parser.add_argument('--port', type=int, default=8400, help='Local port the app under test listens on (default: 8400)')
+    parser.add_argument('--clients', type=int, default=20, help='Concurrent Socket.IO clients kept connected (default: 20)')
+    parser.add_argument('--churn-interval', type=float, default=1.0, help='Seconds between client reconnects (default: 1.0)')
+    parser.add_argument('--hit-interval', type=float, default=10.0, help='Seconds between /debug and /raw-pipe-data hits (default: 10)')
+    parser.add_argument('--input', choices=['udp', 'fifo'], default='udp', help='How metadata reaches the controller (default: udp)')
+    parser.add_argument('--udp-port', type=int, default=5596, help='UDP metadata port for --input udp (default: 5596)')
+    parser.add_argument('--metadata-rate', type=float, default=20.0, help='Synthetic metadata items per second (default: 20)')
+    parser.add_argument('--track-interval', type=float, default=10.0, help='Seconds between track changes with new artwork (default: 10)')
+    parser.add_argument('--tickless', action='store_true', help='Run the controller in tickless idle mode')
+    parser.add_argument('--max-rss-slope', type=float, default=512, help='Allowed RSS growth in KB per hour (default: 512)')
+    parser.add_argument('--max-traced-slope', type=float, default=256, help='Allowed tracemalloc growth in KB per hour (default: 256)')
+    parser.add_argument('--max-fd-slope', type=float, default=0.5, help='Allowed open fd growth per hour (default: 0.5)')
+    parser.add_argument('--max-thread-slope', type=float, default=0.5, help='Allowed thread growth per hour (default: 0.5)')
+    parser.add_argument('--top', type=int, default=10, help='Top allocators to log per sample (default: 10)')
+    parser.add_argument('--traceback-depth', type=int, default=1, help='tracemalloc frames per allocation (default: 1)')
+    parser.add_argument('--csv', type=str, default=None, help='Write all samples to this CSV file')
+    args = parser.parse_args()
+
+    harness = SoakHarness(args)
+    raise SystemExit(0 if harness.run() else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const connectionStatus = document.getElementById('connection-status');
     
     // Socket.io connection
-    const socket = io();
+    // Subscribe while connecting, so the full legacy payload is never sent
+    const socket = io({auth: {topics: ['track', 'visualization']}});
     let isVisualizerRunning = false;
     
     // Audio data buffers
@@ -53,58 +54,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function updateMetadata() {
         fetch('/now-playing')
             .then(response => response.json())
-            .then(data => {
-                trackTitle.textContent = data.title || 'Not Playing';
-                trackArtist.textContent = data.artist || 'No Artist';
-                trackAlbum.textContent = data.album || 'No Album';
-                
-                // Update album artwork if available
-                const albumArt = document.getElementById('album-art');
-                if (data.artwork_url) {
-                    // Clear current content (icon or previous image)
-                    albumArt.innerHTML = '';
-                    
-                    // Create and add the new image
-                    const artworkImg = document.createElement('img');
-                    artworkImg.src = data.artwork_url;
-                    artworkImg.alt = `${data.album || 'Album'} artwork`;
-                    
-                    // Add error handling in case the image fails to load
-                    artworkImg.onerror = () => {
-                        // Use our default SVG instead of the font icon
-                        const defaultImg = document.createElement('img');
-                        defaultImg.src = '/static/artwork/default_album.svg';
-                        defaultImg.alt = 'Default album artwork';
-                        defaultImg.className = 'default-album-art';
-                        albumArt.innerHTML = '';
-                        albumArt.appendChild(defaultImg);
-                        console.error('Failed to load artwork image');
-                    };
-                    
-                    albumArt.appendChild(artworkImg);
-                } else if (albumArt.querySelector('img')) {
-                    // Reset to default SVG if we had artwork but now we don't
-                    const defaultImg = document.createElement('img');
-                    defaultImg.src = '/static/artwork/default_album.svg';
-                    defaultImg.alt = 'Default album artwork';
-                    defaultImg.className = 'default-album-art';
-                    albumArt.innerHTML = '';
-                    albumArt.appendChild(defaultImg);
-                }
-                
-                // Update connection status
-                const isPlaying = data.title !== 'Not Playing';
-                connectionStatus.textContent = isPlaying 
-                    ? 'Connected - Playing' 
-                    : 'Waiting for AirPlay...';
-                connectionStatus.style.color = isPlaying ? '#4CAF50' : '#FFA500';
-                
-                // If not playing, also update visualizer status
-                if (!isPlaying) {
-                    visualizerStatus.textContent = 'Visualizer: Idle';
-                    visualizerStatus.style.color = '#FF9800';
-                }
-            })
+            .then(renderMetadata)
             .catch(error => {
                 console.error('Error fetching metadata:', error);
                 connectionStatus.textContent = 'Connection Error';
@@ -112,6 +62,60 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
     
+    // Render track metadata from /now-playing or a track_update event
+    function renderMetadata(data) {
+        trackTitle.textContent = data.title || 'Not Playing';
+        trackArtist.textContent = data.artist || 'No Artist';
+        trackAlbum.textContent = data.album || 'No Album';
+        
+        // Update album artwork if available
+        const albumArt = document.getElementById('album-art');
+        if (data.artwork) {
+            // Clear current content (icon or previous image)
+            albumArt.innerHTML = '';
+            
+            // Create and add the new image
+            const artworkImg = document.createElement('img');
+            artworkImg.src = data.artwork;
+            artworkImg.alt = `${data.album || 'Album'} artwork`;
+            
+            // Add error handling in case the image fails to load
+            artworkImg.onerror = () => {
+                // Use our default SVG instead of the font icon
+                const defaultImg = document.createElement('img');
+                defaultImg.src = '/static/artwork/default_album.svg';
+                defaultImg.alt = 'Default album artwork';
+                defaultImg.className = 'default-album-art';
+                albumArt.innerHTML = '';
+                albumArt.appendChild(defaultImg);
+                console.error('Failed to load artwork image');
+            };
+            
+            albumArt.appendChild(artworkImg);
+        } else if (albumArt.querySelector('img')) {
+            // Reset to default SVG if we had artwork but now we don't
+            const defaultImg = document.createElement('img');
+            defaultImg.src = '/static/artwork/default_album.svg';
+            defaultImg.alt = 'Default album artwork';
+            defaultImg.className = 'default-album-art';
+            albumArt.innerHTML = '';
+            albumArt.appendChild(defaultImg);
+        }
+        
+        // Update connection status
+        const isPlaying = data.title !== 'Not Playing';
+        connectionStatus.textContent = isPlaying 
+            ? 'Connected - Playing' 
+            : 'Waiting for AirPlay...';
+        connectionStatus.style.color = isPlaying ? '#4CAF50' : '#FFA500';
+        
+        // If not playing, also update visualizer status
+        if (!isPlaying) {
+            visualizerStatus.textContent = 'Visualizer: Idle';
+            visualizerStatus.style.color = '#FF9800';
+        }
+    }
+    
     // Draw the spectrum visualization
     function drawSpectrum() {
         if (!spectrumData || spectrumData.length === 0) return;
@@ -174,9 +178,11 @@ document.addEventListener('DOMContentLoaded', () => {
         maxEnergy = maxEnergy * 0.995; // Slowly decrease max threshold if no loud sounds
         
         // Calculate percentage (0-100) of current volume relative to max
-        const percentage = Math.min(100, (rmsEnergy / maxEnergy) * 100);
-        
-        // Update volume bar
+        setVolumeBar(Math.min(100, (rmsEnergy / maxEnergy) * 100));
+    }
+    
+    // Fill the volume bar to a percentage (0-100)
+    function setVolumeBar(percentage) {
         volumeBar.style.width = `${percentage}%`;
         
         // Change color based on volume level
@@ -243,6 +249,8 @@ document.addEventListener('DOMContentLoaded', () => {
         visualizerStatus.style.color = '#FF0000';
     });
     
+    socket.on('track_update', renderMetadata);
+    
     socket.on('visualization_data', (data) => {
         spectrumData = data.spectrum || [];
         rmsEnergy = data.rms_energy || 0;
@@ -251,6 +259,11 @@ document.addEventListener('DOMContentLoaded', () => {
         updateVolumeMeter();
     });
     
+    // The visualization topic carries the AirPlay volume, already a percentage
+    socket.on('visualization_update', (data) => {
+        setVolumeBar(data.airplay_active ? Math.min(100, data.volume || 0) : 0);
+    });
+    
     // Button event handlers
     startButton.addEventListener('click', startVisualizer);
     stopButton.addEventListener('click', stopVisualizer);
@@ -259,9 +272,6 @@ document.addEventListener('DOMContentLoaded', () => {
     stopButton.disabled = true;
     updateMetadata();
     
-    // Update metadata periodically
-    setInterval(updateMetadata, 2000);
-    
     // Initial canvas size adjustment
     function resizeCanvas() {
         canvas.width = canvas.offsetWidth;
@@ -13,10 +13,14 @@ import binascii
 import threading
 import struct
 import json
+import ctypes
+import re
 from pathlib import Path
 from datetime import datetime
 from PIL import Image, ImageDraw
 
+from utils.wakeups import WakeupCounter
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -45,18 +49,75 @@ DEBUG_CODE_PARSE_ERROR = 'parse_errors'
 DEBUG_CODE_PROCESS_ERROR = 'process_errors'
 DEBUG_CODE_METADATA_UPDATE = 'metadata_updates'
 
+# Seconds without metadata before playback is considered stopped
+PLAYBACK_INACTIVITY_TIMEOUT = 30
+
+# A shell loop that keeps restarting shairport-sync, e.g.
+# sh -c 'while true; do shairport-sync -v; sleep 1; done'
+WRAPPER_LOOP_PATTERN = re.compile(rb'while\s+(?:true|:)\s*;\s*do\s+[^;&|]*shairport-sync')
+
+# How often tickless mode re-checks the pipe path when inotify is unavailable
+PIPE_RECHECK_INTERVAL = 60
+
+# inotify events for entries appearing in or leaving a directory
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+
+
+def watch_directory(path):
+    """
+    Return a non-blocking inotify fd that becomes readable whenever an entry
+    is created, deleted or renamed in path, or None if inotify is unavailable.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
 class AudioController:
-    def __init__(self, pipe_path='/tmp/shairport-sync-metadata'):
+    def __init__(self, pipe_path='/tmp/shairport-sync-metadata', tickless=False, autostart=True,
+                 metadata_input=None):
         """
         Initialize the audio controller.
         
         Args:
             pipe_path: Path to the shairport-sync metadata pipe
+            tickless: Block on real events instead of polling while idle
+            autostart: Start the metadata reader thread immediately
+            metadata_input: Alternative metadata source used instead of the pipe
         """
         self.pipe_path = pipe_path
         self.pipe_fd = None
+        # (st_dev, st_ino) of the FIFO behind pipe_fd, to notice it being replaced
+        self.pipe_identity = None
+        self.pipe_watch_fd = None
+        self.metadata_input = None
         self.running = True
-        self.metadata_lock = threading.Lock()
+        self.tickless = tickless
+        self.wakeups = WakeupCounter()
+        
+        # Self-pipe used to interrupt a blocking select() in the reader thread,
+        # created in start() only when the FIFO reader is used
+        self._wake_r = None
+        self._wake_w = None
+        self._wake_lock = threading.Lock()
+        self._reopen_requested = False
+        
+        # Lets consumers block until new metadata arrives
+        self.update_condition = threading.Condition()
+        self.update_generation = 0
+        # Reentrant: get_current_metadata() calls is_playing() while holding it
+        self.metadata_lock = threading.RLock()
         self.current_metadata = {
             'title': "Not Playing",
             'artist': None,
@@ -85,15 +146,156 @@ class AudioController:
         # Ensure the artwork directory exists
         os.makedirs(os.path.dirname(self.artwork_path), exist_ok=True)
         
+        self.reader_thread = None
+        if metadata_input is not None:
+            self.set_input(metadata_input)
+        if autostart:
+            self.start()
+        
+        logger.info("AudioController initialized")
+
+    def set_input(self, metadata_input):
+        """
+        Read metadata from another source instead of the pipe. The source must
+        provide add_consumer(callback), start(), stop() and a thread attribute,
+        and call callback(item_type, code, data) with 4-byte type and code
+        strings for every complete item, like UDPMetadataReceiver.
+        Must be called before start().
+        """
+        self.metadata_input = metadata_input
+        metadata_input.add_consumer(self._process_input_item)
+
+    def start(self):
+        """Start the metadata reader thread if it is not already running."""
+        if self.reader_thread is not None:
+            return
+        
+        if self.metadata_input is not None:
+            self.metadata_input.start()
+            self.reader_thread = self.metadata_input.thread
+            logger.info(f"Metadata input {type(self.metadata_input).__name__} started")
+            return
+        
         # Ensure the pipe exists with proper permissions
         self._ensure_metadata_pipe()
         
-        # Start the metadata reader thread
-        self.reader_thread = threading.Thread(target=self._metadata_reader_thread)
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.reader_thread = threading.Thread(target=self._metadata_reader_thread,
+                                              name='metadata-reader')
         self.reader_thread.daemon = True
         self.reader_thread.start()
+        logger.info("Metadata reader thread started")
+
+    def set_tickless(self, enabled):
+        """Switch tickless idle mode on or off while running."""
+        if enabled == self.tickless:
+            return
+        self.tickless = enabled
+        logger.info(f"Tickless idle mode {'enabled' if enabled else 'disabled'}")
+        # The pipe is opened differently in each mode, so reopen it
+        self._wake_reader(reopen=True)
+
+    def stop(self):
+        """Stop the reader thread and release anyone waiting for updates."""
+        self.running = False
+        if self.metadata_input is not None:
+            self.metadata_input.stop()
+        self._wake_reader()
+        with self.update_condition:
+            self.update_condition.notify_all()
+
+    def _wake_reader(self, reopen=False):
+        """Interrupt the reader thread's select() call."""
+        if reopen:
+            self._reopen_requested = True
+        with self._wake_lock:
+            if self._wake_w is None:
+                # No FIFO reader running, nothing to wake
+                return
+            try:
+                os.write(self._wake_w, b'\0')
+            except BlockingIOError:
+                # Pipe already full, the reader will wake up anyway
+                pass
+
+    def _drain_wake_pipe(self):
+        """Empty the self-pipe after a wakeup request."""
+        self._drain_fd(self._wake_r)
+
+    def _drain_fd(self, fd):
+        """Read and discard everything pending on a non-blocking fd."""
+        if fd is None:
+            return
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def notify_update(self):
+        """Wake up threads blocked in wait_for_update(), also used for non-metadata events."""
+        with self.update_condition:
+            self.update_generation += 1
+            self.update_condition.notify_all()
+
+    def wait_for_update(self, generation, timeout=None):
+        """
+        Block until metadata changes after the given generation.
         
-        logger.info("AudioController initialized and metadata reader thread started")
+        Args:
+            generation: Last generation seen by the caller
+            timeout: Maximum seconds to wait, or None to wait indefinitely
+            
+        Returns:
+            The current update generation
+        """
+        with self.update_condition:
+            self.update_condition.wait_for(
+                lambda: self.update_generation != generation or not self.running,
+                timeout)
+            return self.update_generation
+
+    def seconds_until_inactive(self):
+        """
+        Return the seconds left before playback times out for inactivity,
+        or None if playback is already considered inactive.
+        """
+        if not self.last_activity_time:
+            return None
+        remaining = self.last_activity_time + PLAYBACK_INACTIVITY_TIMEOUT - time.time()
+        return remaining if remaining > 0 else None
+
+    def shairport_running(self):
+        """
+        Check for a shairport-sync process, including a shell wrapper loop
+        (while true; do ... shairport-sync ...) that restarts it. Scans /proc
+        directly so no child process is forked.
+        """
+        if not os.path.isdir('/proc'):
+            with os.popen('pgrep -x shairport-sync') as proc:
+                return bool(proc.read().strip())
+
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                # Match the executable name, so readers of the metadata pipe
+                # (cat /tmp/shairport-sync-metadata) don't count
+                with open(f'/proc/{pid}/comm', 'rb') as f:
+                    comm = f.read().strip()
+                if comm == b'shairport-sync':
+                    return True
+                if comm in (b'sh', b'bash', b'dash'):
+                    with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                        cmdline = f.read()
+                    if WRAPPER_LOOP_PATTERN.search(cmdline):
+                        return True
+            except OSError:
+                # Process exited while scanning
+                continue
+        return False
 
     def _ensure_metadata_pipe(self):
         """Ensure the metadata pipe exists with correct permissions."""
@@ -130,32 +332,26 @@ class AudioController:
             if not os.path.exists(self.pipe_path):
                 return None
                 
-            # Create a new file descriptor just for this read
+            # Create a new file descriptor just for this read. Opening with
+            # O_NONBLOCK returns immediately even when no writer is attached.
+            temp_fd = os.open(self.pipe_path, os.O_RDONLY | os.O_NONBLOCK)
             try:
-                # Try non-blocking mode with fcntl
-                import fcntl
-                temp_fd = os.open(self.pipe_path, os.O_RDONLY)
-                fcntl.fcntl(temp_fd, fcntl.F_SETFL, os.O_NONBLOCK)
-            except (ImportError, AttributeError):
-                # Fallback to blocking mode
-                temp_fd = os.open(self.pipe_path, os.O_RDONLY)
-            
-            # Try to read some data with timeout using select
-            readable, _, _ = select.select([temp_fd], [], [], 0.5)
-            if temp_fd in readable:
-                # Read up to max_chunks
-                for i in range(max_chunks):
-                    try:
-                        # Read a small chunk
-                        chunk = os.read(temp_fd, 128)
-                        if not chunk:
+                # Try to read some data with timeout using select
+                readable, _, _ = select.select([temp_fd], [], [], 0.5)
+                if temp_fd in readable:
+                    # Read up to max_chunks
+                    for i in range(max_chunks):
+                        try:
+                            # Read a small chunk
+                            chunk = os.read(temp_fd, 128)
+                            if not chunk:
+                                break
+                            result.append(chunk)
+                        except OSError:
                             break
-                        result.append(chunk)
-                    except:
-                        break
-            
-            # Close the temporary file descriptor
-            os.close(temp_fd)
+            finally:
+                # Close the temporary file descriptor on every path
+                os.close(temp_fd)
             
             return result
             
@@ -168,7 +364,15 @@ class AudioController:
         logger.info("Starting metadata reader thread")
         
         while self.running:
+            self.wakeups.tick()
             try:
+                if self._reopen_requested:
+                    self._reopen_requested = False
+                    self._drain_wake_pipe()
+                    if self.pipe_fd is not None:
+                        os.close(self.pipe_fd)
+                        self.pipe_fd = None
+                
                 # Increment attempt counter and update timestamp
                 self.debug_counters[DEBUG_CODE_READ_ATTEMPT] += 1
                 self.last_pipe_read_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -195,7 +399,20 @@ class AudioController:
                     continue
                 
                 # Open the pipe in non-blocking mode
-                if self.pipe_fd is None:
+                if self.pipe_fd is None and self.tickless:
+                    # Holding a write end ourselves means the FIFO never reports
+                    # EOF when shairport-sync closes it, so select() only returns
+                    # on real data (Linux semantics for O_RDWR on a FIFO)
+                    self.pipe_fd = os.open(self.pipe_path, os.O_RDWR | os.O_NONBLOCK)
+                    # Without EOF we'd never notice shairport-sync's service
+                    # recreating the FIFO, so remember which one we opened and
+                    # watch the directory for it being replaced
+                    fd_stat = os.fstat(self.pipe_fd)
+                    self.pipe_identity = (fd_stat.st_dev, fd_stat.st_ino)
+                    if self.pipe_watch_fd is None:
+                        self.pipe_watch_fd = watch_directory(os.path.dirname(os.path.abspath(self.pipe_path)))
+                    logger.info(f"Opened metadata pipe in tickless mode: {self.pipe_path}")
+                elif self.pipe_fd is None:
                     try:
                         # Try to import fcntl for non-blocking mode
                         import fcntl
@@ -211,7 +428,24 @@ class AudioController:
                 
                 # Use select to check if data is available with a timeout
                 try:
-                    readable, _, _ = select.select([self.pipe_fd], [], [], 1.0)
+                    watched = [self.pipe_fd, self._wake_r]
+                    if not self.tickless:
+                        timeout = 1.0
+                    elif self.pipe_watch_fd is not None:
+                        watched.append(self.pipe_watch_fd)
+                        timeout = None
+                    else:
+                        timeout = PIPE_RECHECK_INTERVAL
+                    readable, _, _ = select.select(watched, [], [], timeout)
+                    if self._wake_r in readable:
+                        self._drain_wake_pipe()
+                    if self.tickless and (self.pipe_watch_fd in readable or not readable):
+                        self._drain_fd(self.pipe_watch_fd)
+                        if self._pipe_replaced():
+                            logger.info(f"Metadata pipe was replaced, reopening: {self.pipe_path}")
+                            os.close(self.pipe_fd)
+                            self.pipe_fd = None
+                            continue
                     if self.pipe_fd in readable:
                         # Data is available to read
                         data = os.read(self.pipe_fd, 4)  # Read header (4 bytes)
@@ -258,7 +492,7 @@ class AudioController:
                                 logger.error(f"Error parsing metadata: {e}")
                                 self.debug_counters[DEBUG_CODE_PARSE_ERROR] += 1
                                 self.last_error = f"Error parsing metadata: {e}"
-                    else:
+                    elif not self.tickless and self.running:
                         # No data available
                         time.sleep(0.1)
                 except Exception as e:
@@ -294,6 +528,31 @@ class AudioController:
             except:
                 pass
             self.pipe_fd = None
+        if self.pipe_watch_fd is not None:
+            os.close(self.pipe_watch_fd)
+            self.pipe_watch_fd = None
+        with self._wake_lock:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+
+    def _pipe_replaced(self):
+        """Check whether the pipe path no longer points at the FIFO we hold open."""
+        try:
+            st = os.stat(self.pipe_path)
+        except OSError:
+            return True
+        return (st.st_dev, st.st_ino) != self.pipe_identity
+
+    def _process_input_item(self, item_type, code, data):
+        """Consume one complete item from a pluggable metadata input."""
+        self.debug_counters[DEBUG_CODE_READ_SUCCESS] += 1
+        self.last_pipe_data_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Inputs hand over 4-byte strings and a borrowed buffer
+        self._process_metadata_item(int.from_bytes(item_type, 'big'),
+                                    int.from_bytes(code, 'big'),
+                                    bytes(data))
+        self.debug_counters[DEBUG_CODE_METADATA_UPDATE] += 1
 
     def _process_metadata_item(self, item_type, item_code, item_data):
         """Process a single metadata item from the pipe."""
@@ -367,6 +626,8 @@ class AudioController:
                             progress = (current - start) / (end - start)
                             self.current_metadata['progress'] = progress
                             logger.debug(f"Updated progress: {progress:.2f}")
+            
+            self.notify_update()
                 
         except Exception as e:
             logger.error(f"Error processing metadata item: {e}")
@@ -403,14 +664,13 @@ class AudioController:
         """Check if shairport-sync is actively streaming."""
         # Check if the shairport-sync process is running and activity is recent
         try:
-            # Look for the shairport-sync process
-            with os.popen('pgrep shairport-sync') as proc:
-                if not proc.read().strip():
-                    return False
-            
-            # Check for recent metadata activity
+            # Check for recent metadata activity first, it needs no syscalls
             current_time = time.time()
-            if current_time - self.last_activity_time > 30:  # 30 seconds of inactivity
+            if current_time - self.last_activity_time > PLAYBACK_INACTIVITY_TIMEOUT:
+                return False
+            
+            # Look for the shairport-sync process
+            if not self.shairport_running():
                 return False
             
             # Check if we have meaningful metadata
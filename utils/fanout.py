@@ -0,0 +1,287 @@
+"""
+Multi-worker fan-out support.
+The process that reads shairport-sync metadata publishes topic payloads through
+a Redis message queue, which Flask-SocketIO uses to reach clients connected to
+any worker. The latest payload per topic is also kept on the broker so that
+stateless workers can answer new clients without touching the metadata pipe.
+Every process also shares its subscriber counts and render timings on the
+broker, so stats can be added up and unused topics skipped.
+"""
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Broker key prefix for the latest payload of each topic
+SNAPSHOT_KEY_PREFIX = 'pi-airplay:snapshot:'
+
+# Broker key prefix for a hash of stats per process, one hash per kind of stats
+STATS_KEY_PREFIX = 'pi-airplay:stats:'
+# Channel announcing that a process changed its shared stats
+STATS_CHANNEL = 'pi-airplay:stats-changed'
+
+# Seconds between refreshes of unchanged stats, and the age at which a
+# process that stopped refreshing (crashed) is no longer counted
+STATS_HEARTBEAT = 30
+STATS_MAX_AGE = 3 * STATS_HEARTBEAT
+
+
+class SnapshotStore:
+    def __init__(self, url):
+        """
+        Connect to the broker holding the topic snapshots.
+
+        Args:
+            url: Redis URL, the same one given to Flask-SocketIO as message_queue
+        """
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for --message-queue (pip install redis)")
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def put(self, topic, encoded):
+        """Store the latest encoded payload for a topic."""
+        self.client.set(SNAPSHOT_KEY_PREFIX + topic, encoded)
+
+    def get(self, topic):
+        """Return the latest payload for a topic, or None if none was published."""
+        raw = self.client.get(SNAPSHOT_KEY_PREFIX + topic)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def clear(self, topic):
+        """Drop the payload of a topic that is no longer kept current."""
+        self.client.delete(SNAPSHOT_KEY_PREFIX + topic)
+
+    def put_stats(self, kind, process_id, stats):
+        """
+        Share one process's stats and tell the other processes they changed.
+
+        Args:
+            kind: Kind of stats, such as 'topics'
+            process_id: Identifies the process among the others
+            stats: JSON-serializable dict; an 'updated' timestamp is added
+        """
+        encoded = json.dumps(dict(stats, updated=time.time()), separators=(',', ':'))
+        self.client.hset(STATS_KEY_PREFIX + kind, process_id, encoded)
+        self.client.publish(STATS_CHANNEL, process_id)
+
+    def get_stats(self, kind, max_age=STATS_MAX_AGE):
+        """Return {process_id: stats} for processes that refreshed their stats recently."""
+        cutoff = time.time() - max_age
+        stats = {}
+        for process_id, raw in self.client.hgetall(STATS_KEY_PREFIX + kind).items():
+            entry = json.loads(raw)
+            if entry.get('updated', 0) >= cutoff:
+                stats[process_id.decode('utf-8')] = entry
+        return stats
+
+    def remove_stats(self, kind, process_id):
+        """Stop sharing a process's stats, e.g. when it exits."""
+        self.client.hdel(STATS_KEY_PREFIX + kind, process_id)
+
+    def watch_stats(self):
+        """Yield the id of each process whose shared stats change; blocks in between."""
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(STATS_CHANNEL)
+        for message in pubsub.listen():
+            yield message['data'].decode('utf-8')
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection using the Redis wire protocol."""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.channels = set()
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                command = self._read_command()
+                if command is None:
+                    break
+                self._dispatch(broker, command)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.drop_subscriber(self)
+
+    def _read_command(self):
+        """Read one command as a list of byte strings, or None on disconnect."""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command such as "PING\r\n"
+            return line.split()
+
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            length = int(header[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _dispatch(self, broker, command):
+        name = command[0].upper() if command else b''
+        args = command[1:]
+
+        if name == b'PING':
+            self.send(b'+PONG\r\n')
+        elif name in (b'CLIENT', b'SELECT'):
+            self.send(b'+OK\r\n')
+        elif name == b'SET':
+            broker.values[args[0]] = args[1]
+            self.send(b'+OK\r\n')
+        elif name == b'GET':
+            self.send(encode_bulk(broker.values.get(args[0])))
+        elif name == b'DEL':
+            removed = sum(1 for key in args if broker.values.pop(key, None) is not None)
+            self.send(b':%d\r\n' % removed)
+        elif name == b'HSET':
+            fields = broker.values.setdefault(args[0], {})
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in fields
+                fields[field] = value
+            self.send(b':%d\r\n' % added)
+        elif name == b'HGETALL':
+            fields = broker.values.get(args[0], {})
+            self.send(encode_array([item for pair in list(fields.items()) for item in pair]))
+        elif name == b'HDEL':
+            fields = broker.values.get(args[0], {})
+            removed = sum(1 for field in args[1:] if fields.pop(field, None) is not None)
+            self.send(b':%d\r\n' % removed)
+        elif name == b'PUBLISH':
+            receivers = broker.publish(args[0], args[1])
+            self.send(b':%d\r\n' % receivers)
+        elif name == b'SUBSCRIBE':
+            for channel in args:
+                broker.add_subscriber(channel, self)
+                self.channels.add(channel)
+                self.send(encode_array([b'subscribe', channel, len(self.channels)]))
+        elif name == b'UNSUBSCRIBE':
+            for channel in args or list(self.channels):
+                broker.remove_subscriber(channel, self)
+                self.channels.discard(channel)
+                self.send(encode_array([b'unsubscribe', channel, len(self.channels)]))
+        else:
+            self.send(b'-ERR unknown command\r\n')
+
+    def send(self, data):
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+
+def encode_bulk(value):
+    """Encode a bulk string reply, None becomes a null reply."""
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def encode_array(items):
+    """Encode an array reply of byte strings and integers."""
+    parts = [b'*%d\r\n' % len(items)]
+    for item in items:
+        if isinstance(item, int):
+            parts.append(b':%d\r\n' % item)
+        else:
+            parts.append(encode_bulk(item))
+    return b''.join(parts)
+
+
+class StandInBroker:
+    def __init__(self, host='127.0.0.1', port=0):
+        """
+        Minimal in-process broker speaking enough of the Redis protocol for
+        Flask-SocketIO's message queue and the snapshot store (PING, GET, SET,
+        DEL, HSET, HGETALL, HDEL, PUBLISH, SUBSCRIBE). Meant for tests and load
+        tests, not production.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on, 0 picks a free one
+        """
+        self.values = {}
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), _BrokerHandler)
+        self.server.daemon_threads = True
+        self.server.broker = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        # Only RESP2 is spoken, so keep redis-py from negotiating RESP3 with HELLO
+        return f"redis://{host}:{port}/0?protocol=2"
+
+    def start(self):
+        """Serve connections on a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stand-in-broker')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Stand-in broker listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_subscriber(self, channel, handler):
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(handler)
+
+    def remove_subscriber(self, channel, handler):
+        with self._lock:
+            self._subscribers.get(channel, set()).discard(handler)
+
+    def drop_subscriber(self, handler):
+        """Remove a disconnected client from every channel."""
+        with self._lock:
+            for handlers in self._subscribers.values():
+                handlers.discard(handler)
+
+    def publish(self, channel, data):
+        """Deliver a message to every subscriber and return how many got it."""
+        with self._lock:
+            handlers = list(self._subscribers.get(channel, ()))
+
+        message = encode_array([b'message', channel, data])
+        delivered = 0
+        for handler in handlers:
+            try:
+                handler.send(message)
+                delivered += 1
+            except OSError:
+                self.drop_subscriber(handler)
+        return delivered
+
+
+def wait_for_port(host, port, timeout=10.0):
+    """Block until a TCP port accepts connections or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
@@ -0,0 +1,166 @@
+"""
+Topic bookkeeping for Socket.IO subscriptions.
+Clients subscribe to named topics and are placed in a room of the same name.
+The registry tracks who is subscribed to what and how much each topic sends,
+so payloads are only built for topics somebody is listening to.
+"""
+
+import json
+import threading
+
+# Topics a client can subscribe to, mapped to the event emitted for each
+TOPIC_EVENTS = {
+    'track': 'track_update',
+    'progress': 'progress_update',
+    'visualization': 'visualization_update',
+    'diagnostics': 'diagnostics_update',
+}
+
+# Clients that never subscribe keep receiving the full payload on this topic
+LEGACY_TOPIC = 'metadata_update'
+LEGACY_EVENT = 'metadata_update'
+
+
+def parse_topics(data):
+    """
+    Return the topic names from a subscribe request, given either as
+    {'topics': [...]} or as a bare list.
+
+    Raises:
+        ValueError: If the topics are not a list of strings
+    """
+    topics = data.get('topics') if isinstance(data, dict) else data
+    if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+        raise ValueError("topics must be a list of topic names")
+    return topics
+
+
+def encode_payload(payload):
+    """Serialize a payload the same way for change detection and byte counts."""
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True)
+
+
+def merge_snapshots(snapshots):
+    """Add up TopicRegistry snapshots taken in several processes."""
+    merged = {'clients': 0, 'topics': {}, 'total_bytes_sent': 0}
+    for snapshot in snapshots:
+        merged['clients'] += snapshot.get('clients', 0)
+        merged['total_bytes_sent'] += snapshot.get('total_bytes_sent', 0)
+        for topic, stats in snapshot.get('topics', {}).items():
+            totals = merged['topics'].setdefault(
+                topic, {'subscribers': 0, 'messages_sent': 0, 'bytes_sent': 0})
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+    return merged
+
+
+class TopicRegistry:
+    def __init__(self):
+        """Initialize an empty registry with zeroed per-topic statistics."""
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._last_encoded = {}
+        self.stats = {
+            topic: {'messages': 0, 'bytes': 0}
+            for topic in list(TOPIC_EVENTS) + [LEGACY_TOPIC]
+        }
+
+    def add_client(self, sid):
+        """Register a new client on the legacy topic until it subscribes."""
+        with self._lock:
+            self._subscriptions[sid] = {LEGACY_TOPIC}
+
+    def remove_client(self, sid):
+        """Forget a disconnected client and return the topics it had."""
+        with self._lock:
+            return self._subscriptions.pop(sid, set())
+
+    def subscribe(self, sid, topics):
+        """
+        Subscribe a client to topics, dropping it from the legacy topic once
+        it has at least one known topic.
+
+        Args:
+            sid: Socket.IO session id
+            topics: List of topic names
+
+        Returns:
+            Tuple of (topics joined, topics left); unknown names are ignored
+        """
+        wanted = {topic for topic in topics if topic in TOPIC_EVENTS}
+        with self._lock:
+            current = self._subscriptions.setdefault(sid, set())
+            left = current & {LEGACY_TOPIC} if wanted else set()
+            joined = wanted - current
+            current -= left
+            current |= wanted
+        return joined, left
+
+    def unsubscribe(self, sid, topics):
+        """Unsubscribe a client from topics and return the ones it left."""
+        with self._lock:
+            current = self._subscriptions.get(sid, set())
+            left = current & set(topics)
+            current -= left
+        return left
+
+    def subscriber_count(self, topic):
+        """Return how many clients are subscribed to a topic."""
+        with self._lock:
+            return sum(1 for topics in self._subscriptions.values() if topic in topics)
+
+    def has_subscribers(self, topic):
+        """Check whether any client is subscribed to a topic."""
+        return self.subscriber_count(topic) > 0
+
+    def encode_if_changed(self, topic, payload):
+        """
+        Encode a payload and return it only if it differs from the last one
+        sent on the topic. Returns None when nothing needs to be sent.
+        """
+        encoded = encode_payload(payload)
+        with self._lock:
+            if self._last_encoded.get(topic) == encoded:
+                return None
+            self._last_encoded[topic] = encoded
+        return encoded
+
+    def forget(self, topic):
+        """
+        Drop the last payload sent on a topic, so the next one is always sent.
+        Returns whether there was one.
+        """
+        with self._lock:
+            return self._last_encoded.pop(topic, None) is not None
+
+    def last_encoded(self, topic):
+        """Return the last encoded payload sent on a topic, if any."""
+        with self._lock:
+            return self._last_encoded.get(topic)
+
+    def record_sent(self, topic, encoded, recipients):
+        """Account for one payload delivered to a number of recipients."""
+        size = len(encoded.encode('utf-8'))
+        with self._lock:
+            self.stats[topic]['messages'] += recipients
+            self.stats[topic]['bytes'] += size * recipients
+
+    def snapshot(self):
+        """Return subscriber counts and traffic per topic."""
+        with self._lock:
+            counts = {topic: 0 for topic in self.stats}
+            for topics in self._subscriptions.values():
+                for topic in topics:
+                    counts[topic] += 1
+            return {
+                'clients': len(self._subscriptions),
+                'topics': {
+                    topic: {
+                        'subscribers': counts[topic],
+                        'messages_sent': stats['messages'],
+                        'bytes_sent': stats['bytes']
+                    }
+                    for topic, stats in self.stats.items()
+                },
+                'total_bytes_sent': sum(stats['bytes'] for stats in self.stats.values())
+            }
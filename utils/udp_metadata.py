@@ -0,0 +1,328 @@
+"""
+UDP metadata input for shairport-sync.
+shairport-sync can send metadata as UDP datagrams (the metadata "socket_address"
+and "socket_port" settings) instead of writing to the FIFO. Each datagram holds a
+4-byte type, a 4-byte code and the item data. Items larger than a datagram, such
+as artwork, are split into 'ssnc'/'chnk' packets carrying the chunk index, chunk
+count, and the real type and code before the data.
+
+Unlike a FIFO, a slow reader can't back-pressure shairport-sync, and with a
+multicast address any number of processes can listen to the same stream.
+"""
+
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TYPE = b'ssnc'
+CHUNK_CODE = b'chnk'
+# type, code, chunk index, chunk count, real type, real code
+CHUNK_HEADER = struct.Struct('>4s4sII4s4s')
+ITEM_HEADER = struct.Struct('>4s4s')
+
+# Largest datagram shairport-sync can send
+MAX_DATAGRAM = 65536
+
+
+def encode_packets(item_type, code, data, max_packet=1024):
+    """
+    Encode one metadata item the way shairport-sync sends it, splitting it
+    into chunks when it doesn't fit in max_packet bytes. Used by the local
+    sender stand-in in the benchmark.
+
+    Args:
+        item_type: 4-byte item type such as b'core' or b'ssnc'
+        code: 4-byte item code such as b'minm' or b'PICT'
+        data: Item data
+        max_packet: Largest datagram to send
+    """
+    if ITEM_HEADER.size + len(data) <= max_packet:
+        return [ITEM_HEADER.pack(item_type, code) + data]
+
+    chunk_size = max_packet - CHUNK_HEADER.size
+    total = (len(data) + chunk_size - 1) // chunk_size
+    return [
+        CHUNK_HEADER.pack(CHUNK_TYPE, CHUNK_CODE, index, total, item_type, code)
+        + data[index * chunk_size:(index + 1) * chunk_size]
+        for index in range(total)
+    ]
+
+
+class _ChunkSlot:
+    """One preallocated reassembly buffer."""
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.reset()
+
+    def reset(self):
+        self.key = None
+        self.total = 0
+        self.received = set()
+        self.chunk_size = 0
+        self.length = 0
+        self.started = 0.0
+        self.pending_last = None
+
+
+class ChunkAssembler:
+    def __init__(self, max_item_size=1024 * 1024, slots=4, timeout=2.0):
+        """
+        Reassemble chunked items into a fixed set of preallocated buffers.
+
+        Args:
+            max_item_size: Largest item that can be reassembled, in bytes
+            slots: Number of items that can be in flight at once
+            timeout: Seconds before an incomplete item is dropped
+        """
+        self.max_item_size = max_item_size
+        self.timeout = timeout
+        self.slots = [_ChunkSlot(max_item_size) for _ in range(slots)]
+        self.dropped_incomplete = 0
+        self.dropped_oversize = 0
+
+    def pending(self):
+        """Return whether any item is partially received."""
+        return any(slot.key is not None for slot in self.slots)
+
+    def expire(self, now=None):
+        """Drop items that have been incomplete for longer than the timeout."""
+        now = time.monotonic() if now is None else now
+        for slot in self.slots:
+            if slot.key is not None and now - slot.started > self.timeout:
+                logger.debug(f"Dropping incomplete item {slot.key}: "
+                             f"{len(slot.received)}/{slot.total} chunks")
+                self.dropped_incomplete += 1
+                slot.reset()
+
+    def _slot_for(self, key, total, now):
+        free = None
+        for slot in self.slots:
+            if slot.key == key:
+                if slot.total == total:
+                    return slot
+                # Same item restarted with a different size, drop the old one
+                self.dropped_incomplete += 1
+                slot.reset()
+                free = slot
+                break
+            if slot.key is None and free is None:
+                free = slot
+        if free is None:
+            # All buffers busy: recycle the oldest partial item
+            free = min(self.slots, key=lambda slot: slot.started)
+            self.dropped_incomplete += 1
+            free.reset()
+        free.key = key
+        free.total = total
+        free.started = now
+        return free
+
+    def add(self, item_type, code, index, total, data):
+        """
+        Add one chunk. Returns a memoryview of the complete item once the last
+        missing chunk arrives, otherwise None. The view is only valid until the
+        next call, so consumers must copy what they keep.
+        """
+        if total == 0 or index >= total:
+            return None
+        now = time.monotonic()
+        key = (item_type, code)
+        slot = self._slot_for(key, total, now)
+        if index in slot.received:
+            # A chunk we already have means the sender moved on to a new item
+            # with the same type and code, so the partial one can't complete
+            self.dropped_incomplete += 1
+            slot.reset()
+            slot.key, slot.total, slot.started = key, total, now
+
+        if index < total - 1:
+            # Every chunk but the last has the same size
+            slot.chunk_size = slot.chunk_size or len(data)
+            if len(data) != slot.chunk_size or (total - 1) * slot.chunk_size > self.max_item_size:
+                self.dropped_oversize += 1
+                slot.reset()
+                return None
+            offset = index * slot.chunk_size
+            slot.buffer[offset:offset + len(data)] = data
+        elif slot.chunk_size or total == 1:
+            if not self._place_last(slot, data):
+                return None
+        else:
+            # Last chunk came first; keep it until the chunk size is known
+            slot.pending_last = bytes(data)
+        slot.received.add(index)
+
+        if slot.pending_last is not None and slot.chunk_size:
+            if not self._place_last(slot, slot.pending_last):
+                return None
+            slot.pending_last = None
+
+        if len(slot.received) < total:
+            return None
+        view = memoryview(slot.buffer)[:slot.length]
+        slot.reset()
+        return view
+
+    def _place_last(self, slot, data):
+        """Copy the final chunk into place, which fixes the item length."""
+        offset = (slot.total - 1) * slot.chunk_size
+        if offset + len(data) > self.max_item_size:
+            self.dropped_oversize += 1
+            slot.reset()
+            return False
+        slot.buffer[offset:offset + len(data)] = data
+        slot.length = offset + len(data)
+        return True
+
+
+class UDPMetadataReceiver:
+    def __init__(self, port=5555, bind_address='0.0.0.0', multicast_group=None,
+                 chunk_timeout=2.0, max_item_size=1024 * 1024, wakeups=None):
+        """
+        Receive shairport-sync metadata datagrams and hand complete items to consumers.
+
+        Args:
+            port: UDP port shairport-sync sends to
+            bind_address: Local address to bind
+            multicast_group: Multicast group to join, so several processes can listen
+            chunk_timeout: Seconds before an incomplete chunked item is dropped
+            max_item_size: Largest reassembled item (artwork) in bytes
+            wakeups: Optional WakeupCounter to record receiver wakeups
+        """
+        self.port = port
+        self.bind_address = bind_address
+        self.multicast_group = multicast_group
+        self.assembler = ChunkAssembler(max_item_size=max_item_size, timeout=chunk_timeout)
+        self.wakeups = wakeups
+        self.consumers = []
+        self.running = False
+        self.thread = None
+        self.sock = None
+        self._recv_buffer = bytearray(MAX_DATAGRAM)
+        self._wake_r = self._wake_w = None
+        self.stats = {
+            'packets': 0,
+            'bytes': 0,
+            'items': 0,
+            'chunks': 0,
+            'malformed': 0,
+        }
+
+    def add_consumer(self, callback):
+        """
+        Register a callback(item_type, code, data) for every complete item.
+        item_type and code are 4-byte strings; data is a memoryview that is
+        only valid during the call.
+        """
+        self.consumers.append(callback)
+
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Absorb bursts of artwork chunks while consumers are busy
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+
+        if self.multicast_group:
+            sock.bind(('', self.port))
+            membership = struct.pack('4s4s', socket.inet_aton(self.multicast_group),
+                                     socket.inet_aton(self.bind_address))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        else:
+            sock.bind((self.bind_address, self.port))
+        sock.setblocking(False)
+        return sock
+
+    def start(self):
+        """Open the socket and start the receiver thread."""
+        self.sock = self._open_socket()
+        self._wake_r, self._wake_w = os.pipe()
+        self.running = True
+        self.thread = threading.Thread(target=self._receive_loop, name='metadata-udp')
+        self.thread.daemon = True
+        self.thread.start()
+        where = self.multicast_group or self.bind_address
+        logger.info(f"Listening for UDP metadata on {where}:{self.port}")
+
+    def stop(self):
+        """Stop the receiver thread and close the socket. Safe to call more than once."""
+        if self._wake_w is None:
+            return
+        self.running = False
+        os.write(self._wake_w, b'\0')
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        for fd in (self._wake_r, self._wake_w):
+            os.close(fd)
+        self._wake_r = self._wake_w = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _receive_loop(self):
+        while self.running:
+            # Only wake up on a timer while a chunked item is waiting to expire
+            timeout = self.assembler.timeout if self.assembler.pending() else None
+            readable, _, _ = select.select([self.sock, self._wake_r], [], [], timeout)
+            if self.wakeups is not None:
+                self.wakeups.tick()
+            if self.sock in readable:
+                self._drain_socket()
+            self.assembler.expire()
+
+    def _drain_socket(self):
+        """Read every queued datagram before going back to select()."""
+        view = memoryview(self._recv_buffer)
+        while True:
+            try:
+                size = self.sock.recv_into(self._recv_buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error(f"Error receiving UDP metadata: {e}")
+                return
+            self.stats['packets'] += 1
+            self.stats['bytes'] += size
+            self.handle_packet(view[:size])
+
+    def handle_packet(self, packet):
+        """Parse one datagram, reassembling chunks, and dispatch complete items."""
+        if len(packet) < ITEM_HEADER.size:
+            self.stats['malformed'] += 1
+            return
+        item_type, code = ITEM_HEADER.unpack_from(packet)
+
+        if item_type == CHUNK_TYPE and code == CHUNK_CODE:
+            if len(packet) < CHUNK_HEADER.size:
+                self.stats['malformed'] += 1
+                return
+            _, _, index, total, item_type, code = CHUNK_HEADER.unpack_from(packet)
+            self.stats['chunks'] += 1
+            data = self.assembler.add(item_type, code, index, total, packet[CHUNK_HEADER.size:])
+            if data is None:
+                return
+        else:
+            data = packet[ITEM_HEADER.size:]
+
+        self.stats['items'] += 1
+        for consumer in self.consumers:
+            try:
+                consumer(item_type, code, data)
+            except Exception as e:
+                logger.error(f"Error in UDP metadata consumer: {e}")
+
+    def snapshot(self):
+        """Return receive counters, including dropped chunked items."""
+        stats = dict(self.stats)
+        stats['dropped_incomplete'] = self.assembler.dropped_incomplete
+        stats['dropped_oversize'] = self.assembler.dropped_oversize
+        return stats
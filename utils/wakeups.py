@@ -0,0 +1,79 @@
+"""
+Wakeup accounting for the background threads.
+Each thread calls tick() whenever it returns from a blocking wait, so the
+per-thread wakeup rate shows whether an idle receiver is really idle.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class WakeupCounter:
+    def __init__(self, window=60.0):
+        """
+        Initialize the wakeup counter.
+
+        Args:
+            window: Length in seconds of the sliding window used for rates
+        """
+        self.window = window
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._events = {}
+        self._totals = {}
+
+    def tick(self, name=None):
+        """Record one wakeup for the named thread (defaults to the caller)."""
+        if name is None:
+            name = threading.current_thread().name
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.setdefault(name, deque())
+            events.append(now)
+            self._totals[name] = self._totals.get(name, 0) + 1
+            self._prune(events, now)
+
+    def _prune(self, events, now):
+        """Drop timestamps that have fallen out of the window."""
+        cutoff = now - self.window
+        while events and events[0] < cutoff:
+            events.popleft()
+
+    def rates(self):
+        """Return wakeups per second for each thread over the window."""
+        now = time.monotonic()
+        # Early on the window is not full yet, so divide by the real span
+        span = max(min(self.window, now - self.started), 1.0)
+        with self._lock:
+            result = {}
+            for name, events in self._events.items():
+                self._prune(events, now)
+                result[name] = len(events) / span
+        return result
+
+    def snapshot(self, budget=None):
+        """
+        Return a JSON-friendly summary of the wakeup counters.
+
+        Args:
+            budget: Optional target for the total wakeups per second
+        """
+        rates = self.rates()
+        with self._lock:
+            totals = dict(self._totals)
+
+        total_rate = sum(rates.values())
+        return {
+            'window_seconds': self.window,
+            'threads': {
+                name: {
+                    'total': totals.get(name, 0),
+                    'per_second': round(rate, 3)
+                }
+                for name, rate in sorted(rates.items())
+            },
+            'total_per_second': round(total_rate, 3),
+            'budget_per_second': budget,
+            'within_budget': None if budget is None else total_rate <= budget
+        }